@@ -50,21 +50,20 @@ class BlokImporter:
         blok_path = BlokManager.getPath(self.name)
         _file = join(blok_path, *file_path)
         logger.info("import %r file: %r", Importer, _file)
-        file_to_import = None
-        with open(_file, "rb") as fp:
-            file_to_import = fp.read()
+        if not getattr(Importer, "read_by_open_file", False):
+            # the importer mode reads only ``file_to_import``
+            with open(_file, "rb") as fp:
+                kwargs.setdefault("file_to_import", fp.read())
 
-        importer = Importer.insert(
-            model=model, file_to_import=file_to_import, **kwargs
-        )
+        importer = Importer.insert(model=model, file_path=_file, **kwargs)
         started_at = datetime.now()
         res = importer.run(self.name)
         stoped_at = datetime.now()
         dt = stoped_at - started_at
         logger.info(
             "Create %d entries, Update %d entries (%d.%d sec)",
-            len(res["created_entries"]),
-            len(res["updated_entries"]),
+            res.get("nb_created_entries", len(res.get("created_entries", ()))),
+            res.get("nb_updated_entries", len(res.get("updated_entries", ()))),
             dt.seconds,
             dt.microseconds,
         )
@@ -26,6 +26,10 @@ class AnyBlokIO(Blok):
         "anyblok-core",
     ]
 
+    def update(self, latest_version):
+        if latest_version is not None:
+            self.anyblok.IO.Mapping.fill_primary_key_hash()
+
     @classmethod
     def declare_io(cls):
         from anyblok import Declarations
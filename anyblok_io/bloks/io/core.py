@@ -7,7 +7,7 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 from anyblok import Declarations
-from sqlalchemy import select
+from sqlalchemy.sql.expression import Delete
 
 
 @Declarations.register(Declarations.Core)
@@ -15,34 +15,36 @@ class SqlBase:
     @classmethod
     def execute_sql_statement(cls, statement, *args, **kwargs):
         remove_mapping = kwargs.pop("remove_mapping", True)
-        if remove_mapping:
-            if str(statement).startswith("DELETE FROM "):
-                Mapping = cls.anyblok.IO.Mapping
-                mappings = []
-                stmt = select(statement.table).where(*statement._where_criteria)
-                entries = cls.execute_sql_statement(
-                    stmt, remove_mapping=False
-                ).scalars()
+        if remove_mapping and isinstance(statement, Delete):
+            Mapping = cls.anyblok.IO.Mapping
+            Model = cls.get_model_of_delete_statement(statement)
+            if Model is not None and Mapping.has_mappings(
+                Model.__registry_name__
+            ):
+                Mapping.delete_for_entries(Model, *statement._where_criteria)
 
-                for entry in entries:
-                    mapping = Mapping.get_from_model_and_primary_keys(
-                        entry.__registry_name__, entry.to_primary_keys()
-                    )
-                    if mapping and mapping not in mappings:
-                        mappings.append(mapping)
+        return super(SqlBase, cls).execute_sql_statement(
+            statement, *args, **kwargs
+        )
 
-                res = super(SqlBase, cls).execute_sql_statement(
-                    statement, *args, **kwargs
-                )
+    @classmethod
+    def get_model_of_delete_statement(cls, statement):
+        """Return the model of the entries removed by the DELETE statement,
+        the statement is built on the model or on its table
 
-                for mapping in mappings:
-                    Mapping.delete(mapping.model, mapping.key)
+        :param statement: DELETE statement
+        :rtype: model or None if the table is not the one of a model
+        """
+        Model = statement.entity_description.get("entity")
+        if Model is not None:
+            return Model
 
-                return res
+        table = statement.table
+        for Model in cls.anyblok.loaded_namespaces.values():
+            if getattr(Model, "__table__", None) is table:
+                return Model
 
-        return super(SqlBase, cls).execute_sql_statement(
-            statement, *args, **kwargs
-        )
+        return None
 
     def delete(self, *args, **kwargs):
         """Inherit the Model.delete methods.::
@@ -53,8 +55,8 @@ class SqlBase:
             removed
         """
         remove_mapping = kwargs.pop("remove_mapping", True)
-        if remove_mapping:
-            Mapping = self.anyblok.IO.Mapping
+        Mapping = self.anyblok.IO.Mapping
+        if remove_mapping and Mapping.has_mappings(self.__registry_name__):
             mapping = Mapping.get_from_model_and_primary_keys(
                 self.__registry_name__, self.to_primary_keys()
             )
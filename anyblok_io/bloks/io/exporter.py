@@ -5,6 +5,8 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+from functools import partial
+
 from anyblok import Declarations
 
 from .exceptions import ExporterException
@@ -12,14 +14,33 @@ from .exceptions import ExporterException
 
 @Declarations.register(Declarations.Model.IO)
 class Exporter(Declarations.Mixin.IOMixin):
-    def run(self, entries):
-        for entry in entries:
-            if entry.__registry_name__ != self.model:
-                raise ExporterException(
-                    "The entries must be instance of %r" % self.model
-                )
+    def run(self, entries, **kwargs):
+        """Run the export
+
+        :param entries: list of the entries to export, or an iterator (for
+                        example a query with ``yield_per``) which is
+                        consumed only one time by the export
+        :param kwargs: options of the mode of the exporter
+        :exception: ExporterException
+        """
+        if isinstance(entries, (list, tuple)):
+            for entry in entries:
+                self.check_entry(entry)
+        else:
+            entries = self.iter_checked_entries(entries)
+
+        return self.get_model(self.mode)(self).run(entries, **kwargs)
 
-        return self.get_model(self.mode)(self).run(entries)
+    def check_entry(self, entry):
+        if entry.__registry_name__ != self.model:
+            raise ExporterException(
+                "The entries must be instance of %r" % self.model
+            )
+
+    def iter_checked_entries(self, entries):
+        for entry in entries:
+            self.check_entry(entry)
+            yield entry
 
     @classmethod
     def get_external_id(cls, model):
@@ -44,9 +65,22 @@ class Exporter(Declarations.Mixin.IOMixin):
         Mapping.set(key, entry)
         return key
 
-    def value2str(self, value, ctype, external_id=False, model=None):
+    def get_value2str(self, ctype, external_id=False, model=None):
+        """Return the converter of the values of one column, the formater is
+        got only one time by column
+
+        :param ctype: type of the column
+        :param external_id: if True the values are exported as external ids
+        :param model: model of the foreign key
+        :rtype: callable ``converter(value)``
+        """
         formater = self.get_formater(ctype)
         if external_id:
-            return formater.externalIdValue2str(value, model)
+            return partial(formater.externalIdValue2str, model=model)
 
-        return formater.value2str(value, model)
+        return partial(formater.value2str, model=model)
+
+    def value2str(self, value, ctype, external_id=False, model=None):
+        return self.get_value2str(ctype, external_id=external_id, model=model)(
+            value
+        )
@@ -21,8 +21,12 @@ class Formater:
     def str2value(self, value, model):
         return value
 
-    def _externalIdStr2value(self, value, model):
-        mapping = self.anyblok.IO.Mapping.get(model, value)
+    def _externalIdStr2value(self, value, model, external_ids=None):
+        if external_ids is not None and (model, value) in external_ids:
+            mapping = external_ids[(model, value)]
+        else:
+            mapping = self.anyblok.IO.Mapping.get(model, value)
+
         if mapping is None:
             raise FormaterException(
                 "Unexisting mapping key %r with model %r" % (value, model)
@@ -30,11 +34,15 @@ class Formater:
 
         return mapping
 
-    def externalIdStr2value(self, value, model, fieldname):
-        entry = self._externalIdStr2value(value, model)
+    def externalIdStr2value(self, value, model, fieldname, external_ids=None):
+        entry = self._externalIdStr2value(value, model, external_ids)
         pks = entry.to_primary_keys()
         return pks[fieldname]
 
+    def externalIdStr2keys(self, value):
+        """return the mapping keys used by the value"""
+        return [value] if value else []
+
     def value2str(self, value, model):
         if value is None:
             return ""  # pragma: no cover
@@ -159,11 +167,11 @@ class Many2One(IO.Formater):
 
         return Model.from_primary_keys(**pks)
 
-    def externalIdStr2value(self, value, model, fieldname):
+    def externalIdStr2value(self, value, model, fieldname, external_ids=None):
         if not value:
             return None
 
-        return self._externalIdStr2value(value, model)
+        return self._externalIdStr2value(value, model, external_ids)
 
     def value2str(self, value, model):
         if value is None:
@@ -201,12 +209,17 @@ class Many2Many(IO.Formater):
 
         return [Model.from_primary_keys(**x) for x in pks if x]
 
-    def externalIdStr2value(self, values, model, fieldname):
+    def externalIdStr2value(self, values, model, fieldname, external_ids=None):
+        return [
+            self._externalIdStr2value(value, model, external_ids)
+            for value in self.externalIdStr2keys(values)
+        ]
+
+    def externalIdStr2keys(self, values):
         if not values or values == "null":
             return []
 
-        values = loads(values)
-        return [self._externalIdStr2value(value, model) for value in values]
+        return loads(values)
 
     def value2str(self, values, model):
         if not values:
@@ -5,20 +5,173 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+from functools import partial
+from io import BytesIO
+
 from anyblok import Declarations
-from anyblok.column import Boolean, Integer, LargeBinary
+from anyblok.column import Boolean, Integer, LargeBinary, Selection, Text
+from anyblok.common import anyblok_column_prefix
+from anyblok.mapper import ModelAttribute
+from sqlalchemy import inspect
+
+from .exceptions import ImporterException
+
+RELATIONSHIP_TYPES = ("Many2One", "One2One", "One2Many", "Many2Many")
 
 
 @Declarations.register(Declarations.Model.IO)
 class Importer(Declarations.Mixin.IOMixin):
-    file_to_import = LargeBinary(nullable=False)
+    file_to_import = LargeBinary()
+    file_path = Text()
     offset = Integer(default=0)
     nb_grouped_lines = Integer(nullable=False, default=50)
     commit_at_each_grouped = Boolean(default=True)
     check_import = Boolean(default=False)
+    skip_unchanged = Boolean(default=False)
+    result_mode = Selection(
+        selections=[
+            ("entries", "Entries"),
+            ("primary_keys", "Primary keys"),
+            ("counts", "Counts"),
+        ],
+        default="entries",
+    )
+
+    fk_columns = None
+    fields_descriptions = None
+
+    def run(self, blokname=None, callback=None):
+        """Run the import
+
+        :param blokname: name of the blok of the saved mappings
+        :param callback: function called after each commit with the lists
+                         of the entries created and updated since the last
+                         commit
+        :rtype: dict of result
+        """
+        Importer = self.get_model(self.mode)
+        return Importer(self, blokname=blokname, callback=callback).run()
+
+    def open_file(self):
+        """Return a binary file object on the file to import, the local
+        file ``file_path`` is read by chunk without passing by the database,
+        else the file is read from ``file_to_import``
+
+        :rtype: binary file object, must be closed by the caller
+        :exception: ImporterException
+        """
+        if self.file_path:
+            return open(self.file_path, "rb")
+
+        if self.file_to_import is None:
+            raise ImporterException(
+                "No file to import, fill 'file_to_import' or 'file_path'"
+            )
+
+        return BytesIO(self.file_to_import)
+
+    def keep_results(self, entries, start, expunge=False, exclude=()):
+        """Keep in the list of the result only what the ``result_mode``
+        asks for the entries processed since ``start``:
+
+        * entries: the entries
+        * primary_keys: the primary keys of the entries
+        * counts: nothing, the entries are only counted by the importer
+
+        The entries given by their primary keys are kept as they are.
+
+        :param entries: list of the created or updated entries, or of their
+                        primary keys, modified
+        :param start: index of the first entry not kept yet
+        :param expunge: if True and the entries are not kept, the entries
+                        are removed from the session
+        :param exclude: entries to not remove from the session
+        :rtype: int, index of the next entry to keep
+        """
+        processed = entries[start:]
+        if self.result_mode == "primary_keys":
+            entries[start:] = [
+                entry
+                if isinstance(entry, dict)
+                else self.get_identity_primary_keys(entry)
+                for entry in processed
+            ]
+        elif self.result_mode == "counts":
+            del entries[start:]
+        else:
+            return len(entries)
 
-    def run(self, blokname=None):
-        return self.get_model(self.mode)(self, blokname=blokname).run()
+        if expunge:
+            excluded = {id(entry) for entry in exclude}
+            session = self.anyblok.session
+            for entry in processed:
+                if isinstance(entry, dict) or id(entry) in excluded:
+                    continue
+
+                if entry in session:
+                    self.anyblok.expunge(entry)
+
+        return len(entries)
+
+    def flush_results(self, importer, expunge=False, exclude=()):
+        """Count the entries processed by the importer of the mode since the
+        last call and give them to its callback, then keep in its result
+        only what the ``result_mode`` asks for
+
+        :param importer: importer of the mode, with the lists
+                         ``created_entries`` and ``updated_entries``, their
+                         counts ``nb_created_entries`` and
+                         ``nb_updated_entries``, ``results_start`` and
+                         ``callback``
+        :param expunge: if True and the entries are not kept, the entries
+                        are removed from the session
+        :param exclude: entries to not remove from the session
+        """
+        created_start, updated_start = importer.results_start
+        created = importer.created_entries[created_start:]
+        updated = importer.updated_entries[updated_start:]
+        importer.nb_created_entries += len(created)
+        importer.nb_updated_entries += len(updated)
+        if importer.callback is not None and (created or updated):
+            importer.callback(created, updated)
+
+        importer.results_start = (
+            self.keep_results(
+                importer.created_entries,
+                created_start,
+                expunge=expunge,
+                exclude=exclude,
+            ),
+            self.keep_results(
+                importer.updated_entries,
+                updated_start,
+                expunge=expunge,
+                exclude=exclude,
+            ),
+        )
+
+    @staticmethod
+    def get_identity_primary_keys(entry):
+        """Return the primary keys of the entry from its identity in the
+        session, the entry expired by the commit is not loaded again
+
+        :param entry: instance of a model
+        :rtype: dict primary key: value
+        """
+        state = inspect(entry)
+        if state.identity is None:
+            return entry.to_primary_keys()
+
+        mapper = state.mapper
+        pks = {}
+        for column, value in zip(mapper.primary_key, state.identity):
+            key = mapper.get_property_by_column(column).key
+            if key.startswith(anyblok_column_prefix):
+                key = key[len(anyblok_column_prefix) :]  # noqa: E203
+
+            pks[key] = value
+
+        return pks
 
     def get_key_mapping(self, key):
         Mapping = self.anyblok.IO.Mapping
@@ -33,11 +186,152 @@ class Importer(Declarations.Mixin.IOMixin):
         self.anyblok.commit()
         return True
 
-    def str2value(
-        self, value, ctype, external_id=False, model=None, fieldname=None
+    def is_unchanged(self, entry, values, extend_x2many=False):
+        """Return True if the entry has already got the imported values
+
+        :param entry: existing entry
+        :param values: dict of the imported values
+        :param extend_x2many: if True the x2Many values are added to the
+                              linked entries, they must only be already
+                              linked, else they replace the linked entries
+                              and must be exactly the linked entries
+        :rtype: Boolean
+        """
+        for field, value in values.items():
+            current = getattr(entry, field)
+            if isinstance(value, list):
+                if extend_x2many:
+                    if any(x not in current for x in value):
+                        return False
+                elif set(value) != set(current):
+                    return False
+            elif current != value:
+                return False
+
+        return True
+
+    def get_external_ids(self, keys_by_model):
+        """Resolve in a batch the external ids by model
+
+        :param keys_by_model: dict model: list of the keys
+        :rtype: dict (model, key): instance or None if the key is unknown
+        """
+        Mapping = self.anyblok.IO.Mapping
+        res = {}
+        for model, keys in keys_by_model.items():
+            entries = Mapping.get_many(model, keys)
+            res.update({(model, key): entries.get(key) for key in keys})
+
+        return res
+
+    @classmethod
+    def get_fk_column(cls, model, fieldname):
+        """Return the name of the column of the remote model linked by the
+        field, the name is got only one time by model and field. The
+        relationships have not got a foreign key column, their values are
+        the remote entries
+
+        :param model: registry name of the model
+        :param fieldname: name of the field in the model
+        :rtype: str or None
+        """
+        if cls.fk_columns is None:
+            cls.fk_columns = {}
+
+        key = (model, fieldname)
+        if key not in cls.fk_columns:
+            description = cls.get_fields_description(model).get(fieldname)
+            if description and description["type"] in RELATIONSHIP_TYPES:
+                cls.fk_columns[key] = None
+            else:
+                mapper = ModelAttribute(model, fieldname)
+                cls.fk_columns[key] = mapper.get_fk_column(cls.anyblok)
+
+        return cls.fk_columns[key]
+
+    @classmethod
+    def get_relationship_fields(cls, model, fields):
+        """Return the fields which are relationships, their values are the
+        remote entries and not the values of a column
+
+        :param model: registry name of the model
+        :param fields: names of the fields
+        :rtype: set of the names of the relationship fields
+        """
+        description = cls.get_fields_description(model, fields=fields)
+        return {
+            field
+            for field in fields
+            if field in description
+            and description[field]["type"] in RELATIONSHIP_TYPES
+        }
+
+    @classmethod
+    def get_fields_description(cls, model, fields=None):
+        """Return the description of the fields of the model, the
+        description is got only one time by model until the registry is
+        reloaded
+
+        :param model: registry name of the model
+        :param fields: names of the fields wanted, all the fields if empty
+        :rtype: dict field name: description, must not be modified
+        """
+        if cls.fields_descriptions is None:
+            cls.fields_descriptions = {}
+
+        if model not in cls.fields_descriptions:
+            Model = cls.anyblok.get(model)
+            cls.fields_descriptions[model] = Model.fields_description()
+
+        description = cls.fields_descriptions[model]
+        if not fields:
+            return description
+
+        return {x: y for x, y in description.items() if x in fields}
+
+    def get_str2value(
+        self, ctype, external_id=False, model=None, fieldname=None
     ):
+        """Return the converter of the values of one column, the formater is
+        got only one time by column::
+
+            str2value = importer.get_str2value('Integer')
+            values = [str2value(value) for value in column]
+
+        :param ctype: type of the column
+        :param external_id: if True the values are external ids
+        :param model: model of the foreign key
+        :param fieldname: column of the primary key of the model
+        :rtype: callable ``converter(value)``, or for the external ids
+            ``converter(value, external_ids=None)``
+        """
         formater = self.get_formater(ctype)
         if external_id:
-            return formater.externalIdStr2value(value, model, fieldname)
+            return partial(
+                formater.externalIdStr2value, model=model, fieldname=fieldname
+            )
+
+        return partial(formater.str2value, model=model)
+
+    def str2value(
+        self,
+        value,
+        ctype,
+        external_id=False,
+        model=None,
+        fieldname=None,
+        external_ids=None,
+    ):
+        converter = self.get_str2value(
+            ctype, external_id=external_id, model=model, fieldname=fieldname
+        )
+        if external_id:
+            return converter(value, external_ids=external_ids)
+
+        return converter(value)
+
+    def get_str2external_ids(self, ctype):
+        return self.get_formater(ctype).externalIdStr2keys
 
-        return formater.str2value(value, model)
+    def str2external_ids(self, value, ctype):
+        return self.get_str2external_ids(ctype)(value)
@@ -5,13 +5,21 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
-from datetime import date, datetime
+from collections import OrderedDict
+from datetime import date
 from decimal import Decimal
+from hashlib import sha256
+from json import dumps
 from logging import getLogger
+from operator import attrgetter, methodcaller
 from uuid import UUID
 
 from anyblok.column import Json, String
 from anyblok.declarations import Declarations, hybrid_method
+from sqlalchemy import and_, event, exists, insert, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import bindparam, update
 
 from .exceptions import IOMappingCheckException, IOMappingSetException
 
@@ -53,6 +61,58 @@ register = Declarations.register
 Model = Declarations.Model
 
 
+def get_default_primary_key_converters():
+    """Return the converters of the primary key values saved in the
+    mappings, by type or by class name, for the optional libraries found
+    """
+    converters = {
+        UUID: str,
+        date: methodcaller("isoformat"),
+        Decimal: str,
+    }
+    if has_colour:
+        converters[colour.Color] = attrgetter("hex")
+
+    if has_furl:
+        converters[furl.furl] = str
+
+    if has_pycountry:
+        converters["Country"] = attrgetter("alpha_3")
+
+    if has_phonenumbers:
+        converters[PN] = attrgetter("international")
+
+    return converters
+
+
+# key of the lookup cache of the mappings in the info of the session
+LOOKUP_CACHE = "anyblok_io_mapping_lookup_cache"
+# key of the models checked as unmapped in the info of the session
+UNMAPPED_MODELS = "anyblok_io_mapping_unmapped_models"
+# key of the models whose primary key hashes are filled in the info of the
+# session
+HASHED_MODELS = "anyblok_io_mapping_hashed_models"
+
+
+def clear_session_caches(session, *args):
+    """Clear the caches of the mappings of the session at the end of the
+    transaction, the cached primary keys may be rollbacked, and the
+    mappings may be modified by another session after the commit"""
+    session.info.pop(LOOKUP_CACHE, None)
+    session.info.pop(UNMAPPED_MODELS, None)
+    session.info.pop(HASHED_MODELS, None)
+
+
+for session_event in ("after_commit", "after_soft_rollback"):
+    if not event.contains(Session, session_event, clear_session_caches):
+        event.listen(Session, session_event, clear_session_caches)
+
+
+# primary key types which can be compared by the database with the json
+INTEGER_TYPES = ("Integer", "BigInteger", "SmallInteger")
+STRING_TYPES = ("String", "Text", "Selection", "Sequence")
+
+
 @register(Model.IO)
 class Mapping:
     key = String(primary_key=True)
@@ -60,10 +120,32 @@ class Mapping:
         primary_key=True, size=256, foreign_key=Model.System.Model.use("name")
     )
     primary_key = Json(nullable=False)
+    primary_key_hash = String(size=64, index=True)
     blokname = String(
         label="Blok name", foreign_key=Model.System.Blok.use("name")
     )
 
+    # cache of the models which have got at least one mapping, loaded at
+    # the first probe and kept up to date by the registry
+    mapped_models = None
+
+    # cache of the models which have got mappings without primary key hash
+    # (saved before the column exists), their hashes are filled the first
+    # time the mappings of the model are looked for
+    unhashed_models = None
+
+    # size of the bounded LRU cache of the primary keys found by
+    # (model, key), kept in the session and cleared at the end of each
+    # transaction
+    lookup_cache_size = 1024
+    lookup_cache_hits = 0
+    lookup_cache_misses = 0
+
+    # converters of the primary key values by type, and the converter
+    # resolved for each concrete type
+    primary_key_converters = None
+    primary_key_converters_by_type = None
+
     @hybrid_method
     def filter_by_model_and_key(self, model, key):
         """SQLAlechemy hybrid method to filter by model and key
@@ -82,6 +164,314 @@ class Mapping:
         """
         return (self.model == model) & self.key.in_(keys)
 
+    @classmethod
+    def hash_primary_keys(cls, pks):
+        """Return the canonical hash of the primary keys, used to find
+        the mapping of an entry without scanning all the mappings of the
+        model
+
+        :param pks: dict of the primary keys
+        :rtype: str, hexdigest of the canonical json of the primary keys
+        """
+        pks = {pk: cls.convert_primary_key(value) for pk, value in pks.items()}
+        canonical = dumps(pks, sort_keys=True, separators=(",", ":"))
+        return sha256(canonical.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def get_mapped_models(cls):
+        """Return the models which have got at least one mapping, the
+        result is cached for the registry
+
+        :rtype: dict model: True
+        """
+        if cls.mapped_models is None:
+            models = cls.execute_sql_statement(
+                select(cls.model).distinct()
+            ).scalars()
+            cls.mapped_models = dict.fromkeys(models, True)
+
+        return cls.mapped_models
+
+    @classmethod
+    def has_mappings(cls, model):
+        """Return True if the model may have got mappings, used to not
+        look for the mapping of the entries of the unmapped models. The
+        mappings may be added by another process, so an unmapped model is
+        checked again in the database once by transaction
+
+        :param model: model of the mapping
+        :rtype: Boolean
+        """
+        mapped_models = cls.get_mapped_models()
+        if model in mapped_models:
+            return True
+
+        unmapped_models = cls.anyblok.session.info.setdefault(
+            UNMAPPED_MODELS, set()
+        )
+        if model not in unmapped_models:
+            if cls.exists_mapping(model):
+                mapped_models[model] = True
+                return True
+
+            unmapped_models.add(model)
+
+        return False
+
+    @classmethod
+    def add_mapped_model(cls, model):
+        if cls.mapped_models is not None:
+            cls.mapped_models[model] = True
+
+    @classmethod
+    def exists_mapping(cls, model):
+        """Return True if the model has got at least one mapping in the
+        database
+
+        :param model: model of the mapping
+        :rtype: Boolean
+        """
+        query = select(exists().where(cls.model == model))
+        return cls.execute_sql_statement(query).scalar()
+
+    @classmethod
+    def check_mapped_model(cls, model):
+        """Forget the model after the commit if it has not got mapping
+        anymore, nothing is forgotten if the transaction is rollbacked
+
+        :param model: model of the mapping
+        """
+        if not cls.exists_mapping(model):
+            cls.anyblok.postcommit_hook(
+                cls.__registry_name__, "forget_mapped_model", model
+            )
+
+    @classmethod
+    def forget_mapped_model(cls, model):
+        """Forget the model if it has still not got mapping, a mapping may
+        have been added after the call of ``check_mapped_model``
+
+        :param model: model of the mapping
+        """
+        if cls.mapped_models is not None and not cls.exists_mapping(model):
+            cls.mapped_models.pop(model, None)
+
+    @classmethod
+    def get_lookup_cache(cls, create=False):
+        """Return the lookup cache of the current session
+
+        :param create: if True the cache is created if it does not exist
+        :rtype: OrderedDict (model, key): primary keys or None
+        """
+        info = cls.anyblok.session.info
+        if create and LOOKUP_CACHE not in info:
+            info[LOOKUP_CACHE] = OrderedDict()
+
+        return info.get(LOOKUP_CACHE)
+
+    @classmethod
+    def get_cached_primary_keys(cls, model, key):
+        """Return the primary keys cached for the model and the key
+
+        :param model: model of the mapping
+        :param key: string of the key
+        :rtype: dict primary key: value or None if the key is not cached
+        """
+        lookup_cache = cls.get_lookup_cache()
+        pks = None
+        if lookup_cache is not None:
+            pks = lookup_cache.get((model, key))
+
+        if pks is None:
+            cls.lookup_cache_misses += 1
+            return None
+
+        cls.lookup_cache_hits += 1
+        lookup_cache.move_to_end((model, key))
+        return dict(pks)
+
+    @classmethod
+    def cache_primary_keys(cls, model, key, pks):
+        if not cls.lookup_cache_size:
+            return
+
+        lookup_cache = cls.get_lookup_cache(create=True)
+        lookup_cache[(model, key)] = dict(pks)
+        lookup_cache.move_to_end((model, key))
+        while len(lookup_cache) > cls.lookup_cache_size:
+            lookup_cache.popitem(last=False)
+
+    @classmethod
+    def invalidate_lookup_cache(cls, model=None, *keys):
+        """Remove entries from the lookup cache of the current session::
+
+            Mapping.invalidate_lookup_cache()  # all the entries
+            Mapping.invalidate_lookup_cache('Model.System.Blok')
+            Mapping.invalidate_lookup_cache('Model.System.Blok', 'key')
+
+        :param model: model of the mapping, if None all the cache is cleared
+        :param keys: keys to remove, if empty all the keys of the model
+        """
+        lookup_cache = cls.get_lookup_cache()
+        if not lookup_cache:
+            return
+
+        if model is None:
+            lookup_cache.clear()
+        elif keys:
+            for key in keys:
+                lookup_cache.pop((model, key), None)
+        else:
+            for entry in [x for x in lookup_cache if x[0] == model]:
+                del lookup_cache[entry]
+
+    @classmethod
+    def lookup_cache_info(cls):
+        """Return the statistics of the lookup cache, to tune
+        ``lookup_cache_size``, the size is the one of the cache of the
+        current session
+
+        :rtype: dict with hits, misses, maxsize and currsize
+        """
+        return dict(
+            hits=cls.lookup_cache_hits,
+            misses=cls.lookup_cache_misses,
+            maxsize=cls.lookup_cache_size,
+            currsize=len(cls.get_lookup_cache() or ()),
+        )
+
+    @classmethod
+    def before_insert_orm_event(cls, mapper, connection, target):
+        cls.add_mapped_model(target.model)
+        cls.invalidate_lookup_cache(target.model, target.key)
+        target.primary_key_hash = cls.hash_primary_keys(target.primary_key)
+
+    @classmethod
+    def before_update_orm_event(cls, mapper, connection, target):
+        cls.invalidate_lookup_cache(target.model, target.key)
+        target.primary_key_hash = cls.hash_primary_keys(target.primary_key)
+
+    @classmethod
+    def before_delete_orm_event(cls, mapper, connection, target):
+        cls.invalidate_lookup_cache(target.model, target.key)
+
+    @classmethod
+    def get_unhashed_models(cls):
+        """Return the models which have got mappings without primary key
+        hash, the result is cached for the registry
+
+        :rtype: dict model: True
+        """
+        if cls.unhashed_models is None:
+            models = cls.execute_sql_statement(
+                select(cls.model)
+                .where(cls.primary_key_hash.is_(None))
+                .distinct()
+            ).scalars()
+            cls.unhashed_models = dict.fromkeys(models, True)
+            if cls.unhashed_models:
+                logger.warning(
+                    "Some mappings of %r have not got primary key hash, "
+                    "they are filled the first time the mappings of the "
+                    "model are looked for",
+                    sorted(cls.unhashed_models),
+                )
+
+        return cls.unhashed_models
+
+    @classmethod
+    def filter_by_primary_key_hashes(cls, model, hashes):
+        """Return the where clause of the mappings of the model for the
+        primary key hashes, the mappings of the model without hash are
+        filled before, once by transaction until the commit
+
+        :param model: model of the mapping
+        :param hashes: list of primary key hashes
+        :rtype: where clause
+        """
+        if model in cls.get_unhashed_models():
+            hashed_models = cls.anyblok.session.info.get(HASHED_MODELS, ())
+            if model not in hashed_models:
+                cls.fill_primary_key_hash(model=model)
+
+        return (cls.model == model) & cls.primary_key_hash.in_(hashes)
+
+    @classmethod
+    def fill_primary_key_hash(cls, batch=1000, model=None):
+        """Compute the primary key hash of the mappings which have not
+        got it yet (mappings saved before the column exists), by one
+        executemany ``UPDATE`` by batch of mappings
+
+        :param batch: number of mappings updated by query
+        :param model: model of the mappings to fill, all the models if None.
+                      The model is forgotten by the cache of the unhashed
+                      models after the commit
+        :rtype: int, number of the updated mappings
+        """
+        table = cls.__table__
+        stmt = (
+            update(table)
+            .where(
+                table.c.model == bindparam("b_model"),
+                table.c.key == bindparam("b_key"),
+            )
+            .values(primary_key_hash=bindparam("b_hash"))
+        )
+        query = (
+            select(cls.model, cls.key, cls.primary_key)
+            .where(cls.primary_key_hash.is_(None))
+            .limit(batch)
+        )
+        if model is not None:
+            query = query.where(cls.model == model)
+
+        filled = 0
+        while True:
+            mappings = cls.execute_sql_statement(query).all()
+            if not mappings:
+                break
+
+            cls.execute_sql_statement(
+                stmt,
+                [
+                    dict(
+                        b_model=model_,
+                        b_key=key,
+                        b_hash=cls.hash_primary_keys(pks),
+                    )
+                    for model_, key, pks in mappings
+                ],
+            )
+            filled += len(mappings)
+
+        if model is None:
+            cls.unhashed_models = {}
+            if filled:
+                cls.anyblok.expire_all()
+
+            return filled
+
+        session = cls.anyblok.session
+        session.info.setdefault(HASHED_MODELS, set()).add(model)
+        cls.anyblok.postcommit_hook(
+            cls.__registry_name__, "forget_unhashed_model", model
+        )
+        for entry in list(session.identity_map.values()):
+            if isinstance(entry, cls) and entry.model == model:
+                cls.anyblok.expire(entry, ["primary_key_hash"])
+
+        return filled
+
+    @classmethod
+    def forget_unhashed_model(cls, model):
+        """Forget the model whose primary key hashes are filled and
+        commited
+
+        :param model: model of the mapping
+        """
+        if cls.unhashed_models is not None:
+            cls.unhashed_models.pop(model, None)
+
     def remove_element(self, byquery=False):
         val = self.anyblok.get(self.model).from_primary_keys(**self.primary_key)
         logger.info("Remove entity for %r.%r: %r" % (self.model, self.key, val))
@@ -98,6 +488,7 @@ class Mapping:
         mapping_only = kwargs.get("mapping_only", True)
         byquery = kwargs.get("byquery", False)
 
+        cls.invalidate_lookup_cache(model, *keys)
         filter_ = cls.filter_by_model_and_keys(model, *keys)
         if not mapping_only:
             entries = cls.execute_sql_statement(
@@ -110,6 +501,9 @@ class Mapping:
             cls.delete_sql_statement().where(filter_), remove_mapping=False
         )
         cls.anyblok.expire_all()
+        if res.rowcount:
+            cls.check_mapped_model(model)
+
         return res.rowcount
 
     @classmethod
@@ -120,6 +514,7 @@ class Mapping:
         :param key: string of the key
         :rtype: Boolean True if the mapping is removed
         """
+        cls.invalidate_lookup_cache(model, key)
         filter_ = cls.filter_by_model_and_key(model, key)
         if not mapping_only:
             entry = cls.execute_sql_statement(
@@ -131,6 +526,9 @@ class Mapping:
         res = cls.execute_sql_statement(
             cls.delete_sql_statement().where(filter_), remove_mapping=False
         )
+        if res.rowcount:
+            cls.check_mapped_model(model)
+
         return res.rowcount
 
     @classmethod
@@ -141,6 +539,10 @@ class Mapping:
         :param key: string of the key
         :rtype: dict primary key: value or None
         """
+        pks = cls.get_cached_primary_keys(model, key)
+        if pks is not None:
+            return pks
+
         filter_ = cls.filter_by_model_and_key(model, key)
         pks = (
             cls.execute_sql_statement(
@@ -154,8 +556,41 @@ class Mapping:
             return None
 
         cls.check_primary_keys(model, *pks.keys())
+        cls.cache_primary_keys(model, key, pks)
         return pks
 
+    @classmethod
+    def get_mapping_primary_keys_many(cls, model, keys):
+        """return primary keys for a model and a list of external keys,
+        in one query
+
+        :param model: model of the mapping
+        :param keys: list of the keys
+        :rtype: dict key: dict primary key: value, unknown keys are missing
+        """
+        res = {}
+        missing = set()
+        for key in set(keys):
+            pks = cls.get_cached_primary_keys(model, key)
+            if pks is None:
+                missing.add(key)
+            else:
+                res[key] = pks
+
+        if not missing:
+            return res
+
+        filter_ = cls.filter_by_model_and_keys(model, *missing)
+        query = cls.execute_sql_statement(
+            cls.select_sql_statement(cls.key, cls.primary_key).where(filter_)
+        )
+        for key, pks in query:
+            cls.check_primary_keys(model, *pks.keys())
+            cls.cache_primary_keys(model, key, pks)
+            res[key] = pks
+
+        return res
+
     @classmethod
     def check_primary_keys(cls, model, *pks):
         """check if the all the primary keys match with primary keys of the
@@ -173,29 +608,63 @@ class Mapping:
                 )
 
     @classmethod
-    def convert_primary_key(cls, value):
-        if isinstance(value, UUID):
-            return str(value)
+    def get_primary_key_converters(cls):
+        """Return the converters of the primary key values, by type or by
+        class name
+
+        :rtype: dict type or class name: converter
+        """
+        if cls.primary_key_converters is None:
+            cls.primary_key_converters = get_default_primary_key_converters()
 
-        if isinstance(value, (date, datetime)):
-            return value.isoformat()
+        return cls.primary_key_converters
 
-        if isinstance(value, Decimal):
-            return str(value)
+    @classmethod
+    def register_primary_key_converter(cls, type_, converter):
+        """Add or replace the converter of a primary key type::
 
-        if has_colour and isinstance(value, colour.Color):
-            return value.hex
+            Mapping.register_primary_key_converter(MyType, str)
 
-        if has_furl and isinstance(value, furl.furl):
-            return str(value)
+        :param type_: type or class name of the value, the subclasses are
+            converted too
+        :param converter: callable which return the value to save
+        """
+        cls.get_primary_key_converters()[type_] = converter
+        cls.primary_key_converters_by_type = None
 
-        if has_pycountry and value.__class__.__name__ == "Country":
-            return value.alpha_3
+    @classmethod
+    def get_primary_key_converter(cls, type_):
+        """Return the converter of the concrete type, resolved once by the
+        mro of the type
 
-        if has_phonenumbers and isinstance(value, PN):
-            return value.international
+        :param type_: type of the value
+        :rtype: converter or None if the value is saved as it
+        """
+        if cls.primary_key_converters_by_type is None:
+            cls.primary_key_converters_by_type = {}
+
+        cache = cls.primary_key_converters_by_type
+        if type_ not in cache:
+            converters = cls.get_primary_key_converters()
+            converter = None
+            for klass in type_.__mro__:
+                converter = converters.get(
+                    klass, converters.get(klass.__name__)
+                )
+                if converter is not None:
+                    break
 
-        return value
+            cache[type_] = converter
+
+        return cache[type_]
+
+    @classmethod
+    def convert_primary_key(cls, value):
+        converter = cls.get_primary_key_converter(type(value))
+        if converter is None:
+            return value
+
+        return converter(value)
 
     @classmethod
     def set_primary_keys(
@@ -235,6 +704,88 @@ class Mapping:
 
         return cls.insert(**vals)
 
+    @classmethod
+    def set_many(cls, model, mappings, raiseifexist=True, blokname=None):
+        """Add or update in one time the mappings of a model::
+
+            Mapping.set_many(
+                'Model.System.Blok',
+                [('key1', {'name': 'anyblok-core'}), ...],
+                raiseifexist=False,
+            )
+
+        On PostgreSQL the mappings are written by only one
+        ``INSERT ... ON CONFLICT DO UPDATE``, the other databases remove the
+        existing mappings before inserting them.
+
+        :param model: model of the mappings
+        :param mappings: list of tuple (key, dict of the primary key to save)
+        :param raiseifexist: boolean (True by default), if True and one of
+            the entries exists then an exception is raised
+        :param blokname: name of the blok where come from the mappings
+        :rtype: int, number of the saved mappings
+        :exception: IOMappingSetException
+        """
+        values = {}
+        for key, pks in mappings:
+            if not pks:
+                raise IOMappingSetException(
+                    "No value to save %r for model %r and key %r"
+                    % (pks, model, key)
+                )
+
+            cls.check_primary_keys(model, *pks.keys())
+            pks = {
+                pk: cls.convert_primary_key(value) for pk, value in pks.items()
+            }
+            values[key] = dict(
+                model=model,
+                key=key,
+                primary_key=pks,
+                primary_key_hash=cls.hash_primary_keys(pks),
+                blokname=blokname,
+            )
+
+        if not values:
+            return 0
+
+        if raiseifexist:
+            filter_ = cls.filter_by_model_and_keys(model, *values.keys())
+            key = (
+                cls.execute_sql_statement(
+                    cls.select_sql_statement(cls.key).where(filter_)
+                )
+                .scalars()
+                .first()
+            )
+            if key is not None:
+                raise IOMappingSetException(
+                    "One value found for model %r and key %r" % (model, key)
+                )
+
+            stmt = insert(cls.__table__)
+        elif cls.anyblok.engine.dialect.name == "postgresql":
+            stmt = pg_insert(cls.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["key", "model"],
+                set_=dict(
+                    primary_key=stmt.excluded.primary_key,
+                    primary_key_hash=stmt.excluded.primary_key_hash,
+                    blokname=stmt.excluded.blokname,
+                ),
+            )
+        else:
+            filter_ = cls.filter_by_model_and_keys(model, *values.keys())
+            cls.execute_sql_statement(
+                cls.delete_sql_statement().where(filter_), remove_mapping=False
+            )
+            stmt = insert(cls.__table__)
+
+        cls.execute_sql_statement(stmt.values(list(values.values())))
+        cls.add_mapped_model(model)
+        cls.invalidate_lookup_cache(model, *values.keys())
+        return len(values)
+
     @classmethod
     def set(cls, key, instance, raiseifexist=True, blokname=None):
         """Add or update a mmping with a model and a external key
@@ -270,14 +821,72 @@ class Mapping:
 
         return cls.get_model(model).from_primary_keys(**pks)
 
+    @classmethod
+    def filter_by_primary_keys(cls, Model, *pks):
+        """Return the where clause to find the entries of the model from a
+        list of primary keys, with an ``IN`` if the model has only one
+        primary key, or a tuple ``IN`` on PostgreSQL
+
+        :param Model: model of the entries
+        :param pks: list of dict {primary_key: value, ...}
+        :rtype: where clause
+        """
+        model_pks = Model.get_primary_keys()
+        if len(model_pks) == 1:
+            pk = model_pks[0]
+            return getattr(Model, pk).in_({x[pk] for x in pks})
+
+        if cls.anyblok.engine.dialect.name == "postgresql":
+            columns = tuple_(*[getattr(Model, pk) for pk in model_pks])
+            return columns.in_({tuple(x[pk] for pk in model_pks) for x in pks})
+
+        return or_(
+            *[and_(*Model.get_where_clause_from_primary_keys(**x)) for x in pks]
+        )
+
+    @classmethod
+    def get_many(cls, model, keys):
+        """return instances of the model for a list of external keys, with
+        one query on the mapping and one query on the model
+
+        :param model: model of the mapping
+        :param keys: list of the keys
+        :rtype: dict key: instance of the model, unknown keys are missing
+        """
+        mapping_pks = cls.get_mapping_primary_keys_many(model, keys)
+        if not mapping_pks:
+            return {}
+
+        Model = cls.get_model(model)
+        query = Model.query().filter(
+            cls.filter_by_primary_keys(Model, *mapping_pks.values())
+        )
+        entries = {
+            cls.hash_primary_keys(entry.to_primary_keys()): entry
+            for entry in query.all()
+        }
+        res = {}
+        for key, pks in mapping_pks.items():
+            entry = entries.get(cls.hash_primary_keys(pks))
+            if entry is not None:
+                res[key] = entry
+
+        return res
+
     @classmethod
     def get_from_model_and_primary_keys(cls, model, pks):
-        query = cls.query().filter(cls.model == model)
-        for mapping in query:
-            if mapping.primary_key == pks:
-                return mapping
+        """return the mapping of a model for the primary keys
 
-        return None
+        :param model: model of the mapping
+        :param pks: dict of the primary keys
+        :rtype: instance of the mapping or None
+        """
+        query = cls.query().filter(
+            cls.filter_by_primary_key_hashes(
+                model, [cls.hash_primary_keys(pks)]
+            )
+        )
+        return query.first()
 
     @classmethod
     def get_from_entry(cls, entry):
@@ -304,6 +913,137 @@ class Mapping:
             for m in models
         ]
 
+    @classmethod
+    def filter_by_bloknames(cls, bloknames):
+        """Return the where clause to filter the mappings by blok names,
+        None means the mappings without blok
+
+        :params bloknames: list of blok names
+        """
+        filter_ = cls.blokname.in_([x for x in bloknames if x is not None])
+        if None in bloknames:
+            filter_ = or_(filter_, cls.blokname.is_(None))
+
+        return filter_
+
+    @classmethod
+    def join_primary_keys(cls, Model):
+        """Return the clauses which join the primary keys saved in json with
+        the columns of the model
+
+        :param Model: model of the mapping
+        :rtype: list of clauses or None if the database can not compare the
+            primary keys saved in json with the columns of the model
+        """
+        pks = Model.get_primary_keys()
+        clauses = []
+        for pk, description in Model.fields_description(pks).items():
+            if description["type"] in INTEGER_TYPES:
+                value = cls.primary_key[pk].as_integer()
+            elif description["type"] in STRING_TYPES:
+                value = cls.primary_key[pk].as_string()
+            else:
+                return None
+
+            clauses.append(getattr(Model, pk) == value)
+
+        return clauses
+
+    @classmethod
+    def filter_orphans(cls, model):
+        """Return the where clause of the mappings of the model which are not
+        linked to an existing entry, with a ``NOT EXISTS`` on the table of
+        the model
+
+        :param model: model of the mapping
+        :rtype: where clause or None if the database can not compare the
+            primary keys saved in json with the columns of the model
+        """
+        clauses = cls.join_primary_keys(cls.get_model(model))
+        if clauses is None:
+            return None
+
+        return (cls.model == model) & ~exists().where(*clauses)
+
+    @classmethod
+    def delete_for_entries(cls, Model, *where):
+        """Remove the mappings of the entries of the model found by the where
+        clause, with only one DELETE::
+
+            Mapping.delete_for_entries(Blok, Blok.state == 'uninstalled')
+
+        :param Model: model of the entries
+        :param where: where clauses to find the entries
+        :rtype: int, number of the removed mappings
+        """
+        model = Model.__registry_name__
+        clauses = cls.join_primary_keys(Model)
+        if clauses is not None:
+            filter_ = (cls.model == model) & exists().where(*clauses, *where)
+        else:
+            stmt = select(
+                *[
+                    getattr(Model, pk).label(pk)
+                    for pk in Model.get_primary_keys()
+                ]
+            ).where(*where)
+            hashes = {
+                cls.hash_primary_keys(dict(row._mapping))
+                for row in Model.execute_sql_statement(
+                    stmt, remove_mapping=False
+                )
+            }
+            if not hashes:
+                return 0
+
+            filter_ = cls.filter_by_primary_key_hashes(model, hashes)
+
+        stmt = cls.delete_sql_statement().where(filter_)
+        res = cls.execute_sql_statement(
+            stmt.execution_options(synchronize_session="fetch"),
+            remove_mapping=False,
+        )
+        if res.rowcount:
+            cls.invalidate_lookup_cache(model)
+            cls.check_mapped_model(model)
+
+        return res.rowcount
+
+    @classmethod
+    def get_orphan_keys(cls, model, *filters, chunk=1000):
+        """Return the keys of the mappings of the model which are not linked
+        to an existing entry, the mappings are read and the entries are
+        checked by chunk
+
+        :param model: model of the mapping
+        :param filters: where clauses to filter the mappings
+        :param chunk: number of mappings checked by query
+        :rtype: list of the keys
+        """
+        Model = cls.get_model(model)
+        stmt = select(cls.key, cls.primary_key).where(
+            cls.model == model, *filters
+        )
+        mappings = cls.execute_sql_statement(
+            stmt.execution_options(stream_results=True)
+        )
+        keys = []
+        for mappings_chunk in mappings.partitions(chunk):
+            entries = Model.from_multi_primary_keys(
+                *[pks for _, pks in mappings_chunk]
+            )
+            hashes = {
+                cls.hash_primary_keys(entry.to_primary_keys())
+                for entry in entries
+            }
+            keys.extend(
+                key
+                for key, pks in mappings_chunk
+                if cls.hash_primary_keys(pks) not in hashes
+            )
+
+        return keys
+
     @classmethod
     def clean(cls, bloknames=None, models=None):
         """Clean all mapping with removed object linked::
@@ -316,28 +1056,51 @@ class Mapping:
 
                 Mapping.clean(bloknames=[None])
 
-        :params bloknames: filter by blok, keep the order to remove the mapping
-        :params models: filter by model, keep the order to remove the mapping
+        The mappings are removed by one ``DELETE ... WHERE NOT EXISTS`` by
+        model, if the primary keys of the model can not be compared by the
+        database, the entries are checked by chunk
+
+        :params bloknames: filter by blok
+        :params models: filter by model
         """
-        if bloknames is None:
-            bloknames = cls.anyblok.System.Blok.query().all().name + [None]
-        elif not isinstance(bloknames, (list, tuple)):
-            bloknames = [bloknames]
-        models = cls.__get_models(models)
+        filters = []
+        if bloknames is not None:
+            if not isinstance(bloknames, (list, tuple)):
+                bloknames = [bloknames]
+
+            filters.append(cls.filter_by_bloknames(bloknames))
+
+        if models is not None:
+            filters.append(cls.model.in_(cls.__get_models(models)))
+
+        models = cls.execute_sql_statement(
+            select(cls.model).where(*filters).distinct()
+        ).scalars()
 
         removed = 0
-        for blokname in bloknames:
-            for model in models:
-                query = cls.query().filter_by(blokname=blokname, model=model)
-                for key in query.all().key:
-                    if cls.get(model, key) is None:
-                        cls.delete(model, key)
-                        removed += 1
+        for model in models.all():
+            filter_ = cls.filter_orphans(model)
+            if filter_ is None:
+                filter_ = cls.filter_by_model_and_keys(
+                    model, *cls.get_orphan_keys(model, *filters)
+                )
+
+            stmt = cls.delete_sql_statement().where(filter_, *filters)
+            res = cls.execute_sql_statement(
+                stmt.execution_options(synchronize_session="fetch"),
+                remove_mapping=False,
+            )
+            if res.rowcount:
+                cls.invalidate_lookup_cache(model)
+                cls.check_mapped_model(model)
+                removed += res.rowcount
 
         return removed
 
     @classmethod
-    def delete_for_blokname(cls, blokname, models=None, byquery=False):
+    def delete_for_blokname(
+        cls, blokname, models=None, byquery=False, batch=False
+    ):
         """Clean all mapping with removed object linked::
 
             Mapping.clean('My blok')
@@ -350,8 +1113,14 @@ class Mapping:
 
         :params blokname: filter by blok
         :params models: filter by model, keep the order to remove the mapping
+        :params byquery: remove the entries by query
+        :params batch: if True, the entries are removed model by model, with
+            one DELETE by model if byquery, then the mappings are removed with
+            one DELETE and the session is flushed only one time
         """
         models = cls.__get_models(models)
+        if batch:
+            return cls._delete_for_blokname_by_batch(blokname, models, byquery)
 
         removed = 0
         for model in models:
@@ -363,3 +1132,46 @@ class Mapping:
                     removed += 1
 
         return removed
+
+    @classmethod
+    def _delete_for_blokname_by_batch(cls, blokname, models, byquery):
+        filters = []
+        cleaned_models = []
+        for model in models:
+            query = cls.query().filter_by(blokname=blokname, model=model)
+            entries = cls.get_many(model, query.all().key)
+            if not entries:
+                continue
+
+            if byquery:
+                Model = cls.get_model(model)
+                pks = [entry.to_primary_keys() for entry in entries.values()]
+                Model.execute_sql_statement(
+                    Model.delete_sql_statement().where(
+                        cls.filter_by_primary_keys(Model, *pks)
+                    ),
+                    remove_mapping=False,
+                )
+                for entry in set(entries.values()):
+                    entry.expunge()
+            else:
+                for entry in set(entries.values()):
+                    logger.info("Remove entity for %r: %r" % (model, entry))
+                    entry.delete(flush=False, remove_mapping=False)
+
+            filters.append(cls.filter_by_model_and_keys(model, *entries))
+            cleaned_models.append(model)
+
+        if not filters:
+            return 0
+
+        res = cls.execute_sql_statement(
+            cls.delete_sql_statement().where(or_(*filters)),
+            remove_mapping=False,
+        )
+        cls.anyblok.flush()
+        for model in cleaned_models:
+            cls.invalidate_lookup_cache(model)
+            cls.check_mapped_model(model)
+
+        return res.rowcount
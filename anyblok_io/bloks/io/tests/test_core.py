@@ -6,7 +6,7 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
-from sqlalchemy import func
+from sqlalchemy import delete, func
 
 
 @pytest.mark.usefixtures("rollback_registry")
@@ -52,3 +52,65 @@ class TestIOCore:
             Blok.delete_sql_statement().filter_by(name="Test")
         )
         self.checkUnExist()
+
+    def test_delete_statement_on_table_with_mapping(self):
+        Mapping = self.registry.IO.Mapping
+        Blok = self.registry.System.Blok
+        blok = Blok.insert(name="Test", version="0.0.0")
+        Mapping.set("test", blok)
+        table = Blok.__table__
+        Blok.execute_sql_statement(
+            delete(table).where(table.c.name == "nothing")
+        )
+        self.checkExist()
+        Blok.execute_sql_statement(delete(table).where(table.c.name == "Test"))
+        self.checkUnExist()
+
+    def test_delete_statement_with_many_mappings(self):
+        Mapping = self.registry.IO.Mapping
+        Blok = self.registry.System.Blok
+        for i in range(3):
+            blok = Blok.insert(name="Test%d" % i, version="0.0.0")
+            Mapping.set("test%d" % i, blok)
+
+        core = Blok.query().get("anyblok-core")
+        Mapping.set("test", core)
+        Blok.execute_sql_statement(
+            Blok.delete_sql_statement()
+            .where(Blok.name.like("Test%"))
+            .execution_options(synchronize_session="fetch")
+        )
+        assert not Mapping.query().filter(Mapping.key.like("test_")).count()
+        self.checkExist()
+
+    def test_delete_for_entries_by_hash(self, monkeypatch):
+        Mapping = self.registry.IO.Mapping
+        Blok = self.registry.System.Blok
+        monkeypatch.setattr(
+            Mapping, "join_primary_keys", classmethod(lambda cls, Model: None)
+        )
+        blok = Blok.insert(name="Test", version="0.0.0")
+        Mapping.set("test", blok)
+        self.checkExist()
+        assert Mapping.delete_for_entries(Blok, Blok.name == "Test") == 1
+        self.checkUnExist()
+        assert Mapping.delete_for_entries(Blok, Blok.name == "Test") == 0
+
+    def test_delete_without_mapping_does_not_look_for_it(self, monkeypatch):
+        Mapping = self.registry.IO.Mapping
+        Exporter = self.registry.IO.Exporter
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Mapping must not be looked for")
+
+        monkeypatch.setattr(Mapping, "mapped_models", {})
+        monkeypatch.setattr(Mapping, "delete_for_entries", fail)
+        monkeypatch.setattr(Mapping, "get_from_model_and_primary_keys", fail)
+        for i in range(2):
+            Exporter.insert(
+                model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+            )
+
+        Exporter.query().first().delete()
+        Exporter.execute_sql_statement(Exporter.delete_sql_statement())
+        assert not Exporter.query().count()
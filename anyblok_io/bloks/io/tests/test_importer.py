@@ -5,7 +5,12 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+from types import SimpleNamespace
+
 import pytest
+from sqlalchemy import event
+
+from ..exceptions import ImporterException
 
 
 @pytest.mark.usefixtures("rollback_registry")
@@ -36,3 +41,167 @@ class TestImporter:
     def test_commit(self):
         importer = self.create_importer()
         assert importer.commit() is True
+
+    def test_open_file_from_file_to_import(self):
+        importer = self.create_importer(file_to_import=b"content")
+        with importer.open_file() as fp:
+            assert fp.read() == b"content"
+
+    def test_open_file_from_file_path(self, tmp_path):
+        path = tmp_path / "file.csv"
+        path.write_bytes(b"content")
+        importer = self.create_importer(file_path=str(path))
+        with importer.open_file() as fp:
+            assert fp.read() == b"content"
+
+    def test_open_file_without_file(self):
+        importer = self.create_importer()
+        with pytest.raises(ImporterException):
+            importer.open_file()
+
+    def test_keep_results_entries(self):
+        blok = self.registry.System.Blok.query().first()
+        importer = self.create_importer()
+        entries = [blok]
+        assert importer.keep_results(entries, 0, expunge=True) == 1
+        assert entries == [blok]
+        assert blok in self.registry.session
+
+    def test_keep_results_primary_keys(self):
+        blok = self.registry.System.Blok.query().first()
+        importer = self.create_importer(result_mode="primary_keys")
+        entries = ["already kept", blok]
+        assert importer.keep_results(entries, 1) == 2
+        assert entries == ["already kept", {"name": blok.name}]
+        assert blok in self.registry.session
+
+    def test_keep_results_primary_keys_of_expired_entries(self):
+        Blok = self.registry.System.Blok
+        entries = Blok.query().limit(3).all()
+        names = [{"name": blok.name} for blok in entries]
+        importer = self.create_importer(result_mode="primary_keys")
+        self.registry.expire_all()
+        statements = []
+
+        def count_statements(*args):
+            statements.append(args)
+
+        engine = self.registry.engine
+        event.listen(engine, "before_cursor_execute", count_statements)
+        try:
+            assert importer.keep_results(entries, 0) == 3
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statements)
+
+        assert entries == names
+        assert statements == []
+
+    def test_keep_results_counts_and_expunge(self):
+        Blok = self.registry.System.Blok
+        blok1, blok2 = Blok.query().limit(2).all()
+        importer = self.create_importer(result_mode="counts")
+        entries = [blok1, blok2]
+        assert (
+            importer.keep_results(entries, 0, expunge=True, exclude=[blok2])
+            == 0
+        )
+        assert entries == []
+        assert blok1 not in self.registry.session
+        assert blok2 in self.registry.session
+
+    def test_flush_results(self):
+        Blok = self.registry.System.Blok
+        blok1, blok2, blok3 = Blok.query().limit(3).all()
+        batches = []
+        mode_importer = SimpleNamespace(
+            created_entries=[blok1, blok2],
+            updated_entries=[blok3],
+            nb_created_entries=0,
+            nb_updated_entries=0,
+            results_start=(1, 0),
+            callback=lambda created, updated: batches.append(
+                (created, updated)
+            ),
+        )
+        importer = self.create_importer(result_mode="counts")
+        importer.flush_results(mode_importer)
+        assert batches == [([blok2], [blok3])]
+        assert mode_importer.nb_created_entries == 1
+        assert mode_importer.nb_updated_entries == 1
+        assert mode_importer.created_entries == [blok1]
+        assert mode_importer.updated_entries == []
+        assert mode_importer.results_start == (1, 0)
+
+    def test_get_external_ids(self):
+        blok = self.registry.System.Blok.query().first()
+        self.registry.IO.Mapping.set("test_external_id", blok)
+        importer = self.create_importer()
+        res = importer.get_external_ids(
+            {"Model.System.Blok": ["test_external_id", "unknown"]}
+        )
+        assert res == {
+            ("Model.System.Blok", "test_external_id"): blok,
+            ("Model.System.Blok", "unknown"): None,
+        }
+
+    def test_get_fk_column(self, monkeypatch):
+        Importer = self.registry.IO.Importer
+        monkeypatch.setattr(Importer, "fk_columns", None)
+        assert Importer.get_fk_column("Model.System.Column", "model") is None
+        assert Importer.fk_columns == {("Model.System.Column", "model"): None}
+        Importer.fk_columns[("Model.System.Column", "model")] = "cached"
+        assert (
+            Importer.get_fk_column("Model.System.Column", "model") == "cached"
+        )
+
+    def test_get_fields_description(self, monkeypatch):
+        Importer = self.registry.IO.Importer
+        monkeypatch.setattr(Importer, "fields_descriptions", None)
+        description = Importer.get_fields_description("Model.System.Blok")
+        assert description == self.registry.System.Blok.fields_description()
+        assert Importer.get_fields_description("Model.System.Blok") is (
+            description
+        )
+        assert Importer.get_fields_description(
+            "Model.System.Blok", fields=["name"]
+        ) == {"name": description["name"]}
+
+    def test_get_str2value(self):
+        importer = self.create_importer()
+        str2value = importer.get_str2value("Integer")
+        assert [str2value(x) for x in ("1", "2")] == [1, 2]
+
+    def test_get_str2value_external_id(self):
+        blok = self.registry.System.Blok.query().first()
+        self.registry.IO.Mapping.set("test_external_id", blok)
+        importer = self.create_importer()
+        str2value = importer.get_str2value(
+            "Many2One",
+            external_id=True,
+            model="Model.System.Blok",
+            fieldname="name",
+        )
+        assert str2value("test_external_id") == blok
+
+    def test_is_unchanged(self):
+        blok = self.registry.System.Blok.query().first()
+        importer = self.create_importer()
+        assert importer.is_unchanged(blok, {"name": blok.name})
+        assert not importer.is_unchanged(blok, {"name": "other"})
+
+    def test_is_unchanged_x2many(self):
+        entry = SimpleNamespace(links=["a", "b"])
+        importer = self.create_importer()
+        assert importer.is_unchanged(entry, {"links": ["b", "a"]})
+        assert not importer.is_unchanged(entry, {"links": ["a"]})
+        assert not importer.is_unchanged(entry, {"links": ["a", "b", "c"]})
+
+    def test_is_unchanged_x2many_extended(self):
+        entry = SimpleNamespace(links=["a", "b"])
+        importer = self.create_importer()
+        assert importer.is_unchanged(
+            entry, {"links": ["a"]}, extend_x2many=True
+        )
+        assert not importer.is_unchanged(
+            entry, {"links": ["a", "c"]}, extend_x2many=True
+        )
@@ -9,6 +9,8 @@ from json import dumps
 
 import pytest
 
+from ..exceptions import FormaterException
+
 
 @pytest.mark.usefixtures("rollback_registry")
 class TestImporterFormater:
@@ -16,9 +18,15 @@ class TestImporterFormater:
     def transact(self, rollback_registry):
         self.registry = rollback_registry
 
-    def get_value(self, value, ctype, external_id=False, model=None):
+    def get_value(
+        self, value, ctype, external_id=False, model=None, external_ids=None
+    ):
         return self.registry.IO.Importer().str2value(
-            value, ctype, external_id=external_id, model=model
+            value,
+            ctype,
+            external_id=external_id,
+            model=model,
+            external_ids=external_ids,
         )
 
     def test_datetime(self):
@@ -274,3 +282,35 @@ class TestImporterFormater:
             key, "One2One", external_id=True, model="Model.System.Model"
         )
         assert value == model
+
+    def test_many2one_external_ids_already_resolved(self):
+        model = self.registry.System.Model.from_primary_keys(
+            name="Model.System.Model"
+        )
+        value = self.get_value(
+            "formater_mapping",
+            "Many2One",
+            external_id=True,
+            model="Model.System.Model",
+            external_ids={("Model.System.Model", "formater_mapping"): model},
+        )
+        assert value == model
+
+    def test_many2one_external_ids_already_resolved_unknown(self):
+        with pytest.raises(FormaterException):
+            self.get_value(
+                "formater_mapping",
+                "Many2One",
+                external_id=True,
+                model="Model.System.Model",
+                external_ids={("Model.System.Model", "formater_mapping"): None},
+            )
+
+    def test_str2external_ids(self):
+        Importer = self.registry.IO.Importer()
+        assert Importer.str2external_ids("key", "Many2One") == ["key"]
+        assert Importer.str2external_ids("", "Many2One") == []
+        assert Importer.str2external_ids(
+            dumps(["key1", "key2"]), "Many2Many"
+        ) == ["key1", "key2"]
+        assert Importer.str2external_ids("null", "One2Many") == []
@@ -7,6 +7,7 @@
 # obtain one at http://mozilla.org/MPL/2.0/.
 from datetime import date, datetime
 from decimal import Decimal
+from operator import attrgetter
 from uuid import uuid1
 
 import pytest
@@ -95,6 +96,57 @@ class TestIOMapping:
                 dict(),
             )
 
+    def test_set_many(self):
+        columns = {
+            "test_%s" % m.code: m for m in self.Column.query().limit(5).all()
+        }
+        res = self.Mapping.set_many(
+            self.Column.__registry_name__,
+            [
+                (key, column.to_primary_keys())
+                for key, column in columns.items()
+            ],
+            blokname="anyblok-core",
+        )
+        assert res == 5
+        for key, column in columns.items():
+            mapping = self.Mapping.query().filter_by(key=key).one()
+            assert mapping.model == column.__registry_name__
+            assert mapping.primary_key == column.to_primary_keys()
+            assert mapping.blokname == "anyblok-core"
+            assert self.Mapping.get_from_entry(column) is mapping
+
+    def test_set_many_without_mapping(self):
+        assert self.Mapping.set_many(self.Column.__registry_name__, []) == 0
+
+    def test_set_many_without_pks(self):
+        with pytest.raises(IOMappingSetException):
+            self.Mapping.set_many(
+                self.Column.__registry_name__, [("test_set_many", {})]
+            )
+
+    def test_set_many_with_raise(self):
+        column = self.Column.query().first()
+        self.Mapping.set("test_set_many", column)
+        with pytest.raises(IOMappingSetException):
+            self.Mapping.set_many(
+                column.__registry_name__,
+                [("test_set_many", column.to_primary_keys())],
+            )
+
+    def test_set_many_without_raise(self):
+        column1, column2 = self.Column.query().limit(2).all()
+        self.Mapping.set("test_set_many", column1)
+        self.Mapping.set_many(
+            column2.__registry_name__,
+            [("test_set_many", column2.to_primary_keys())],
+            raiseifexist=False,
+        )
+        assert (
+            self.Mapping.get(column2.__registry_name__, "test_set_many")
+            == column2
+        )
+
     def test_set(self):
         column = self.Column.query().first()
         res = self.Mapping.set("test_set", column)
@@ -134,6 +186,39 @@ class TestIOMapping:
         mapping = self.Mapping.get(column.__registry_name__, "test_get")
         assert mapping == column
 
+    def test_get_mapping_primary_keys_many(self):
+        column = self.Column.query().first()
+        self.Mapping.set("test_get_pks", column)
+        mapping = self.Mapping.get_mapping_primary_keys_many(
+            column.__registry_name__, ["test_get_pks", "unknown"]
+        )
+        assert mapping == {
+            "test_get_pks": dict(model=column.model, name=column.name)
+        }
+
+    def test_get_many(self):
+        columns = {
+            "test_%s" % m.code: m for m in self.Column.query().limit(5).all()
+        }
+        for key, instance in columns.items():
+            self.Mapping.set(key, instance)
+
+        entries = self.Mapping.get_many(
+            self.Column.__registry_name__, list(columns.keys()) + ["unknown"]
+        )
+        assert entries == columns
+
+    def test_get_many_with_one_primary_key(self):
+        blok = self.Blok.query().first()
+        self.Mapping.set("test_get_many", blok)
+        entries = self.Mapping.get_many(
+            blok.__registry_name__, ["test_get_many"]
+        )
+        assert entries == {"test_get_many": blok}
+
+    def test_get_many_without_key(self):
+        assert self.Mapping.get_many(self.Blok.__registry_name__, []) == {}
+
     def test_delete(self):
         column = self.Column.query().first()
         self.Mapping.set("test_delete", column)
@@ -219,6 +304,43 @@ class TestIOMapping:
             .count()
         )
 
+    def test_clean_keep_linked_mappings(self):
+        blok = self.Blok.insert(name="Test", version="0.0.0")
+        self.Mapping.set("test", blok)
+        self.Mapping.set("test_core", self.Blok.query().get("anyblok-core"))
+        column = self.Column.query().first()
+        self.Mapping.set("test_column", column)
+        self.registry.execute(text("DELETE FROM system_blok WHERE name='Test'"))
+        removed = self.Mapping.clean()
+        assert removed == 1
+        assert self.Mapping.get("Model.System.Blok", "test_core")
+        assert self.Mapping.get(column.__registry_name__, "test_column")
+
+    def test_get_orphan_keys(self):
+        blok = self.Blok.insert(name="Test", version="0.0.0")
+        self.Mapping.set("test", blok)
+        self.Mapping.set("test_core", self.Blok.query().get("anyblok-core"))
+        self.registry.execute(text("DELETE FROM system_blok WHERE name='Test'"))
+        assert self.Mapping.get_orphan_keys("Model.System.Blok", chunk=1) == [
+            "test"
+        ]
+
+    def test_get_orphan_keys_in_several_chunks(self):
+        for name in ("Test1", "Test2", "Test3"):
+            blok = self.Blok.insert(name=name, version="0.0.0")
+            self.Mapping.set(name.lower(), blok)
+
+        self.Mapping.set("test_core", self.Blok.query().get("anyblok-core"))
+        self.registry.execute(
+            text("DELETE FROM system_blok WHERE name in ('Test1', 'Test3')")
+        )
+        keys = self.Mapping.get_orphan_keys(
+            "Model.System.Blok",
+            self.Mapping.key.in_(["test1", "test2", "test3", "test_core"]),
+            chunk=2,
+        )
+        assert sorted(keys) == ["test1", "test3"]
+
     def test_clean_by_bloknames(self):
         self.Blok.insert(name="Test", version="0.0.0")
         blok = self.Blok.insert(name="Test2", version="0.0.0")
@@ -346,6 +468,242 @@ class TestIOMapping:
         entry = Mapping.get(blok.__registry_name__, mapping.key)
         assert entry == blok
 
+    def test_primary_key_hash_filled_on_insert(self):
+        blok = self.Blok.query().first()
+        mapping = self.Mapping.set("test", blok)
+        assert mapping.primary_key_hash == self.Mapping.hash_primary_keys(
+            blok.to_primary_keys()
+        )
+
+    def test_hash_primary_keys_does_not_depend_on_order(self):
+        assert self.Mapping.hash_primary_keys(
+            {"model": "Model.System.Blok", "name": "name"}
+        ) == self.Mapping.hash_primary_keys(
+            {"name": "name", "model": "Model.System.Blok"}
+        )
+
+    def test_get_from_model_and_primary_keys_without_mapping(self):
+        blok = self.Blok.query().first()
+        assert (
+            self.Mapping.get_from_model_and_primary_keys(
+                blok.__registry_name__, blok.to_primary_keys()
+            )
+            is None
+        )
+
+    def test_fill_primary_key_hash(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "unhashed_models", None)
+        blok1, blok2 = self.Blok.query().limit(2).all()
+        self.Mapping.set("test1", blok1)
+        self.Mapping.set("test2", blok2)
+        self.registry.execute(
+            text("UPDATE io_mapping SET primary_key_hash = NULL")
+        )
+        self.registry.expire_all()
+        assert self.Mapping.fill_primary_key_hash(batch=1) == 2
+        assert self.Mapping.get_unhashed_models() == {}
+        mapping = self.Mapping.get_from_model_and_primary_keys(
+            blok1.__registry_name__, blok1.to_primary_keys()
+        )
+        assert mapping.key == "test1"
+        assert mapping.primary_key_hash == self.Mapping.hash_primary_keys(
+            blok1.to_primary_keys()
+        )
+
+    def test_get_from_model_and_primary_keys_without_hash(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "unhashed_models", None)
+        blok = self.Blok.query().first()
+        self.Mapping.set("test", blok)
+        self.registry.execute(
+            text("UPDATE io_mapping SET primary_key_hash = NULL")
+        )
+        self.registry.expire_all()
+        assert "Model.System.Blok" in self.Mapping.get_unhashed_models()
+        mapping = self.Mapping.get_from_model_and_primary_keys(
+            blok.__registry_name__, blok.to_primary_keys()
+        )
+        assert mapping.key == "test"
+
+    def test_fill_primary_key_hash_of_the_model_looked_for(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "unhashed_models", None)
+        blok = self.Blok.query().first()
+        self.Mapping.set("test", blok)
+        self.registry.execute(
+            text("UPDATE io_mapping SET primary_key_hash = NULL")
+        )
+        self.registry.expire_all()
+        fill_primary_key_hash = self.Mapping.fill_primary_key_hash
+        calls = []
+
+        def fill(**kwargs):
+            calls.append(kwargs)
+            return fill_primary_key_hash(**kwargs)
+
+        monkeypatch.setattr(self.Mapping, "fill_primary_key_hash", fill)
+        for i in range(2):
+            mapping = self.Mapping.get_from_model_and_primary_keys(
+                blok.__registry_name__, blok.to_primary_keys()
+            )
+            assert mapping.key == "test"
+
+        assert calls == [dict(model="Model.System.Blok")]
+        assert mapping.primary_key_hash == self.Mapping.hash_primary_keys(
+            blok.to_primary_keys()
+        )
+        assert "Model.System.Blok" in self.Mapping.get_unhashed_models()
+        self.registry.apply_postcommit_hook()
+        assert "Model.System.Blok" not in self.Mapping.get_unhashed_models()
+
+    def test_delete_entry_with_mapping_without_hash(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "unhashed_models", None)
+        blok = self.Blok.insert(name="Test", version="0.0.0")
+        self.Mapping.set("test", blok)
+        self.registry.execute(
+            text("UPDATE io_mapping SET primary_key_hash = NULL")
+        )
+        self.registry.expire_all()
+        blok.delete()
+        assert self.Mapping.get("Model.System.Blok", "test") is None
+
+    def test_has_mappings(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "mapped_models", None)
+        Exporter = self.registry.IO.Exporter
+        assert not self.Mapping.has_mappings("Model.IO.Exporter")
+        exporter = Exporter.insert(
+            model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+        )
+        self.Mapping.set("test", exporter)
+        assert self.Mapping.has_mappings("Model.IO.Exporter")
+
+    def test_has_mappings_after_set_many(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "mapped_models", None)
+        assert not self.Mapping.has_mappings("Model.IO.Exporter")
+        Exporter = self.registry.IO.Exporter
+        exporter = Exporter.insert(
+            model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+        )
+        self.Mapping.set_many(
+            "Model.IO.Exporter", [("test", exporter.to_primary_keys())]
+        )
+        assert self.Mapping.has_mappings("Model.IO.Exporter")
+
+    def test_forget_mapped_model_after_commit(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "mapped_models", None)
+        Exporter = self.registry.IO.Exporter
+        exporter = Exporter.insert(
+            model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+        )
+        self.Mapping.set("test", exporter)
+        self.Mapping.set("test2", exporter)
+        self.Mapping.delete("Model.IO.Exporter", "test")
+        self.registry.apply_postcommit_hook()
+        assert self.Mapping.has_mappings("Model.IO.Exporter")
+        self.Mapping.delete("Model.IO.Exporter", "test2")
+        assert self.Mapping.has_mappings("Model.IO.Exporter")
+        self.registry.apply_postcommit_hook()
+        assert not self.Mapping.has_mappings("Model.IO.Exporter")
+
+    def test_keep_mapped_model_set_again_before_commit(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "mapped_models", None)
+        Exporter = self.registry.IO.Exporter
+        exporter = Exporter.insert(
+            model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+        )
+        self.Mapping.set("test", exporter)
+        self.Mapping.delete("Model.IO.Exporter", "test")
+        self.Mapping.set("test2", exporter)
+        self.registry.apply_postcommit_hook()
+        assert self.Mapping.has_mappings("Model.IO.Exporter")
+        exporter.delete()
+        assert self.Mapping.get("Model.IO.Exporter", "test2") is None
+
+    def test_has_mappings_set_by_another_process(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "mapped_models", {})
+        blok = self.Blok.query().first()
+        query = text(
+            "INSERT INTO io_mapping (model, key, primary_key) "
+            "VALUES ('Model.System.Blok', 'test', :primary_key)"
+        ).bindparams(primary_key='{"name": "%s"}' % blok.name)
+        self.registry.execute(query)
+        assert self.Mapping.has_mappings("Model.System.Blok")
+
+    def test_has_mappings_checked_again_after_commit(self, monkeypatch):
+        monkeypatch.setattr(self.Mapping, "mapped_models", {})
+        blok = self.Blok.query().first()
+        session = self.registry.session
+        assert not self.Mapping.has_mappings("Model.System.Blok")
+        query = text(
+            "INSERT INTO io_mapping (model, key, primary_key) "
+            "VALUES ('Model.System.Blok', 'test', :primary_key)"
+        ).bindparams(primary_key='{"name": "%s"}' % blok.name)
+        self.registry.execute(query)
+        assert not self.Mapping.has_mappings("Model.System.Blok")
+        session.dispatch.after_commit(session)
+        assert self.Mapping.has_mappings("Model.System.Blok")
+
+    def test_lookup_cache(self, monkeypatch):
+        self.Mapping.invalidate_lookup_cache()
+        monkeypatch.setattr(self.Mapping, "lookup_cache_hits", 0)
+        monkeypatch.setattr(self.Mapping, "lookup_cache_misses", 0)
+        blok = self.Blok.query().first()
+        self.Mapping.set("test", blok)
+        assert self.Mapping.get("Model.System.Blok", "test") == blok
+        assert self.Mapping.get("Model.System.Blok", "test") == blok
+        assert self.Mapping.lookup_cache_info() == dict(
+            hits=1, misses=2, maxsize=1024, currsize=1
+        )
+
+    def test_lookup_cache_is_bounded(self, monkeypatch):
+        self.Mapping.invalidate_lookup_cache()
+        monkeypatch.setattr(self.Mapping, "lookup_cache_size", 2)
+        for blok in self.Blok.query().limit(3).all():
+            self.Mapping.set("test_" + blok.name, blok)
+            self.Mapping.get("Model.System.Blok", "test_" + blok.name)
+
+        assert self.Mapping.lookup_cache_info()["currsize"] == 2
+
+    def test_lookup_cache_invalidated_by_delete(self):
+        blok = self.Blok.query().first()
+        self.Mapping.set("test", blok)
+        assert self.Mapping.get("Model.System.Blok", "test") == blok
+        self.Mapping.delete("Model.System.Blok", "test")
+        assert self.Mapping.get("Model.System.Blok", "test") is None
+
+    def test_lookup_cache_invalidated_by_set(self):
+        blok1, blok2 = self.Blok.query().limit(2).all()
+        self.Mapping.set("test", blok1)
+        assert self.Mapping.get("Model.System.Blok", "test") == blok1
+        self.Mapping.set("test", blok2, raiseifexist=False)
+        assert self.Mapping.get("Model.System.Blok", "test") == blok2
+
+    def test_lookup_cache_cleared_on_rollback(self):
+        blok = self.Blok.query().first()
+        self.Mapping.set("test", blok)
+        self.Mapping.get("Model.System.Blok", "test")
+        lookup_cache = self.Mapping.get_lookup_cache()
+        assert ("Model.System.Blok", "test") in lookup_cache
+        self.registry.rollback()
+        assert self.Mapping.get_lookup_cache() is None
+        assert self.Mapping.get("Model.System.Blok", "test") is None
+
+    def test_lookup_cache_cleared_on_commit(self):
+        blok = self.Blok.query().first()
+        self.Mapping.set("test", blok)
+        self.Mapping.get("Model.System.Blok", "test")
+        session = self.registry.session
+        assert ("Model.System.Blok", "test") in self.Mapping.get_lookup_cache()
+        session.dispatch.after_commit(session)
+        assert self.Mapping.get_lookup_cache() is None
+
+    def test_lookup_cache_in_the_session(self):
+        blok = self.Blok.query().first()
+        self.Mapping.set("test", blok)
+        self.Mapping.get("Model.System.Blok", "test")
+        info = self.registry.session.info
+        lookup_cache = info["anyblok_io_mapping_lookup_cache"]
+        assert self.Mapping.get_lookup_cache() is lookup_cache
+        assert ("Model.System.Blok", "test") in lookup_cache
+
     def test_delete_for_blokname(self):
         self.Blok.insert(name="Test", version="0.0.0")
         assert not (self.Mapping.query().filter_by(blokname="Test").count())
@@ -357,6 +715,41 @@ class TestIOMapping:
         assert removed == 10
         assert not (self.Mapping.query().filter_by(blokname="Test").count())
 
+    def test_delete_for_blokname_by_batch(self):
+        Exporter = self.registry.IO.Exporter
+        self.Blok.insert(name="Test", version="0.0.0")
+        for i in range(5):
+            exporter = Exporter.insert(
+                model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+            )
+            self.Mapping.set("test_%d" % i, exporter, blokname="Test")
+
+        removed = self.Mapping.delete_for_blokname(
+            "Test", models=[Exporter], batch=True
+        )
+        assert removed == 5
+        assert not (self.Mapping.query().filter_by(blokname="Test").count())
+        assert not Exporter.query().count()
+
+    def test_delete_for_blokname_by_batch_and_by_query(self):
+        Exporter = self.registry.IO.Exporter
+        self.Blok.insert(name="Test", version="0.0.0")
+        for i in range(5):
+            exporter = Exporter.insert(
+                model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+            )
+            self.Mapping.set("test_%d" % i, exporter, blokname="Test")
+
+        removed = self.Mapping.delete_for_blokname(
+            "Test", models=[Exporter], byquery=True, batch=True
+        )
+        assert removed == 5
+        assert not (self.Mapping.query().filter_by(blokname="Test").count())
+        assert not Exporter.query().count()
+
+    def test_delete_for_blokname_by_batch_without_mapping(self):
+        assert self.Mapping.delete_for_blokname("Test", batch=True) == 0
+
     def test_delete_for_blokname_filter_by_model_1(self):
         self.Blok.insert(name="Test", version="0.0.0")
         nb_column = self.Column.query().count()
@@ -442,6 +835,27 @@ class TestIOMapping:
         color = "#f5f5f5"
         assert self.Mapping.convert_primary_key(colour.Color(color)) == color
 
+    def test_convert_primary_key_not_converted(self):
+        assert self.Mapping.convert_primary_key(1) == 1
+        assert self.Mapping.convert_primary_key("1") == "1"
+
+    def test_register_primary_key_converter(self, monkeypatch):
+        class MyType:
+            def __init__(self, value):
+                self.value = value
+
+        class MySubType(MyType):
+            pass
+
+        monkeypatch.setattr(self.Mapping, "primary_key_converters", None)
+        monkeypatch.setattr(
+            self.Mapping, "primary_key_converters_by_type", None
+        )
+        assert self.Mapping.convert_primary_key(MySubType(1)).value == 1
+        self.Mapping.register_primary_key_converter(MyType, attrgetter("value"))
+        assert self.Mapping.convert_primary_key(MySubType(1)) == 1
+        assert self.Mapping.primary_key_converters_by_type[MySubType]
+
     def test_check_wrong_primary_keys(self):
         with pytest.raises(IOMappingCheckException):
             self.Mapping.check_primary_keys("Model.System.Model", "id")
@@ -7,6 +7,7 @@
 # obtain one at http://mozilla.org/MPL/2.0/.
 from csv import DictWriter
 from io import StringIO
+from operator import attrgetter
 
 from anyblok import Declarations
 from anyblok.column import Selection, String
@@ -44,8 +45,8 @@ class Field(Mixin.IOCSVFieldMixin):
             "external_id": "External ID",
         }
 
-    def _get_fields_description(self, name, entry):
-        Model = self.get_model(entry.__registry_name__)
+    def _get_fields_description(self, name, model):
+        Model = self.get_model(model)
         fields_description = Model.fields_description(fields=[name])
         if name not in fields_description:
             raise CSVExporterException(
@@ -54,34 +55,39 @@ class Field(Mixin.IOCSVFieldMixin):
 
         return fields_description[name]
 
-    def _value2str(self, exporter, name, entry, external_id):
-        fields_description = self._get_fields_description(name, entry)
+    def _get_value2str(self, exporter, name, model, external_id):
+        fields_description = self._get_fields_description(name, model)
         if fields_description["primary_key"] and external_id:
-            return self.anyblok.IO.Exporter.get_key_mapping(entry)
+            return self.anyblok.IO.Exporter.get_key_mapping
 
-        ctype = fields_description["type"]
-        model = fields_description["model"]
-        return exporter.value2str(
-            getattr(entry, name), ctype, external_id=external_id, model=model
+        converter = exporter.get_value2str(
+            fields_description["type"],
+            external_id=external_id,
+            model=fields_description["model"],
         )
+        getter = attrgetter(name)
+        return lambda entry: converter(getter(entry))
 
-    def _rc_get_sub_entry(self, name, entry):
-        fields_description = self._get_fields_description(name, entry)
+    def _get_sub_entry_getter(self, name, model):
+        fields_description = self._get_fields_description(name, model)
         if fields_description["type"] in ("Many2One", "One2One"):
-            return getattr(entry, name)
+            return attrgetter(name), fields_description["model"]
 
         elif fields_description["model"]:
-            model = fields_description["model"]
-            Model = self.anyblok.get(model)
-            mapper = ModelAdapter(entry)
-            pks = {
-                col.get_fk_column(self.anyblok): (
-                    getattr(entry, col.attribute_name)
+            sub_model = fields_description["model"]
+            Model = self.anyblok.get(sub_model)
+            mapper = ModelAdapter(model)
+            columns = [
+                (col.get_fk_column(self.anyblok), col.attribute_name)
+                for col in mapper.foreign_keys_for(self.anyblok, sub_model)
+            ]
+
+            def get_sub_entry(entry):
+                return Model.from_primary_keys(
+                    **{pk: getattr(entry, attr) for pk, attr in columns}
                 )
-                for col in mapper.foreign_keys_for(self.anyblok, model)
-            }
 
-            return Model.from_primary_keys(**pks)
+            return get_sub_entry, sub_model
 
         else:
             raise CSVExporterException(
@@ -89,19 +95,37 @@ class Field(Mixin.IOCSVFieldMixin):
                 "or has not a foreign key"
             )
 
-    def value2str(self, exporter, entry):
-        def _rc_get_value(names, entry):
-            if not names:
-                return ""  # pragma: no cover
-            elif len(names) == 1:
-                external_id = False if self.mode == "any" else True
-                return self._value2str(exporter, names[0], entry, external_id)
-            else:
-                return _rc_get_value(
-                    names[1:], self._rc_get_sub_entry(names[0], entry)
-                )
+    def get_value2str(self, exporter, model):
+        """Return the converter of the entries of the model for this field,
+        the descriptions of the fields and the formater are got only one
+        time by export::
+
+            value2str = field.get_value2str(exporter, 'Model.System.Blok')
+            values = [value2str(entry) for entry in entries]
+
+        :param exporter: exporter of the field
+        :param model: model of the exported entries
+        :rtype: callable ``converter(entry)``
+        """
+        names = self.name.split(".")
+        getters = []
+        for name in names[:-1]:
+            getter, model = self._get_sub_entry_getter(name, model)
+            getters.append(getter)
+
+        external_id = False if self.mode == "any" else True
+        converter = self._get_value2str(exporter, names[-1], model, external_id)
+
+        def value2str(entry):
+            for getter in getters:
+                entry = getter(entry)
 
-        return _rc_get_value(self.name.split("."), entry)
+            return converter(entry)
+
+        return value2str
+
+    def value2str(self, exporter, entry):
+        return self.get_value2str(exporter, entry.__registry_name__)(entry)
 
     def format_header(self):
         if self.mode == "any":
@@ -151,12 +175,16 @@ class CSV:
             quotechar=self.exporter.csv_quotechar,
         )
         writer.writeheader()
+        converters = [
+            (
+                field.format_header(),
+                field.get_value2str(self.exporter, self.exporter.model),
+            )
+            for field in self.exporter.fields_to_export
+        ]
         for entry in entries:
             writer.writerow(
-                {
-                    field.format_header(): field.value2str(self.exporter, entry)
-                    for field in self.exporter.fields_to_export
-                }
+                {header: value2str(entry) for header, value2str in converters}
             )
 
         csvfile.seek(0)
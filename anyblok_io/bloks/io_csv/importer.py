@@ -5,12 +5,13 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
-from csv import DictReader
-from io import StringIO
+from csv import reader
+from io import TextIOWrapper
 
 from anyblok import Declarations
-from anyblok.column import Selection
-from anyblok.mapper import ModelAdapter, ModelAttribute
+from anyblok.column import BigInteger, Boolean, Integer, Selection, String
+from anyblok.mapper import ModelAdapter
+from sqlalchemy import bindparam, insert, update
 
 from .exceptions import CSVImporterException
 
@@ -46,6 +47,11 @@ class Importer(Mixin.IOCSVMixin):
         ],
         default="create",
     )
+    csv_encoding = String(nullable=False, default="utf-8")
+    csv_bulk_insert = Boolean(default=False)
+    csv_offset_position = BigInteger()
+    csv_offset_line_num = Integer()
+    csv_bulk_update = Boolean(default=False)
 
     @classmethod
     def get_mode_choices(cls):
@@ -56,41 +62,127 @@ class Importer(Mixin.IOCSVMixin):
 
 @register(IO.Importer)
 class CSV:
-    def __init__(self, importer, blokname=None):
+    # the file to import is read by ``Importer.open_file``
+    read_by_open_file = True
+
+    def __init__(self, importer, blokname=None, callback=None):
         self.importer = importer
+        self.callback = callback
         self.error_found = []
+        self.file = None
         self.reader = None
+        self.headers = None
+        self.line_num_base = 0
+        self.columns = {}
         self.created_entries = []
         self.updated_entries = []
+        self.nb_created_entries = 0
+        self.nb_updated_entries = 0
+        self.results_start = (0, 0)
+        self.unchanged = 0
         self.header_pks = []
         self.header_external_id = None
         self.header_external_ids = {}
         self.header_fields = []
+        self.relationship_fields = set()
         self.fields_description = {}
+        self.Model = None
+        self.external_id_column = None
+        self.fields_converters = None
+        self.pks_converters = None
+        self.external_ids_converters = None
+        self.external_keys_converters = None
+        self.external_ids = {}
+        self.entries = None
+        self.values_to_insert = None
+        self.values_to_update = None
+        self.mappings_to_set = None
         self.blokname = blokname
 
     def commit(self):
         if self.error_found:
             return False
 
-        self.importer.offset = self.reader.line_num - 1
-        self.importer.commit()
+        line_num = self.line_num_base + self.reader.line_num
+        self.importer.offset = line_num - 1
+        self.importer.csv_offset_line_num = line_num
+        self.importer.csv_offset_position = self.get_position()
+        self.importer.flush_results(self, expunge=self.importer.commit())
         return True
 
+    def get_position(self):
+        """Return the position in the file at the end of the last read row,
+        the reader reads the file line by line only when the row needs it, so
+        the position is never in a multiline quoted value"""
+        if self.file is None:
+            return None
+
+        position = self.file.tell()
+        if position >= 2**63:
+            # the state of the decoder is in the position, too big to save
+            return None
+
+        return position
+
+    def read_lines(self):
+        """Iterate on the lines of the file by ``readline``, contrary to
+        ``next`` the position of the file stays available"""
+        line = self.file.readline()
+        while line:
+            yield line
+            line = self.file.readline()
+
     def get_reader(self):
-        csvfile = StringIO()
-        csvfile.write(self.importer.file_to_import.decode("utf-8"))
-        csvfile.seek(0)
-        self.reader = DictReader(
-            csvfile,
+        self.file = TextIOWrapper(
+            self.importer.open_file(),
+            encoding=self.importer.csv_encoding,
+            newline="",
+        )
+        self.reader = reader(
+            self.read_lines(),
             delimiter=self.importer.csv_delimiter,
             quotechar=self.importer.csv_quotechar,
         )
+        self.headers = next(self.reader, None)
+
+    def read_row(self):
+        """Return the next not empty row of the reader, completed with None
+        if the row is shorter than the header"""
+        row = next(self.reader)
+        while row == []:
+            row = next(self.reader)
+
+        missing = len(self.headers) - len(row)
+        if missing > 0:
+            row.extend([None] * missing)
+
+        return row
+
+    def seek_offset(self):
+        """Go directly to the position saved by the last commit, if it is
+        the position of the offset
+
+        :rtype: Boolean, True if the position is used
+        """
+        importer = self.importer
+        if (
+            not importer.offset
+            or importer.csv_offset_position is None
+            or importer.csv_offset_line_num != importer.offset + 1
+        ):
+            return False
+
+        self.file.seek(importer.csv_offset_position)
+        self.line_num_base = importer.csv_offset_line_num - self.reader.line_num
+        return True
 
     def consume_offset(self):
+        if self.seek_offset():
+            return
+
         try:
             for offset in range(self.importer.offset):
-                next(self.reader)
+                self.read_row()
         except StopIteration:
             pass
 
@@ -98,17 +190,17 @@ class CSV:
         res = []
         try:
             for offset in range(self.importer.nb_grouped_lines):
-                res.append(next(self.reader))
+                res.append(self.read_row())
         except StopIteration:
             pass
 
         return res
 
     def get_header(self):
-        headers = self.reader.fieldnames
-        Model = self.anyblok.get(self.importer.model)
-        self.fields_description = Model.fields_description(
-            fields=[h.split("/")[0] for h in headers]
+        headers = self.headers
+        self.columns = {header: index for index, header in enumerate(headers)}
+        self.fields_description = self.importer.get_fields_description(
+            self.importer.model, fields=[h.split("/")[0] for h in headers]
         )
 
         for header in headers:
@@ -130,10 +222,293 @@ class CSV:
                 else:
                     self.header_fields.append(name)
 
+        self.relationship_fields = self.importer.get_relationship_fields(
+            self.importer.model,
+            self.header_fields + list(self.header_external_ids.values()),
+        )
+        self.compile_converters()
+
+    def compile_converters(self):
+        """Get one time the columns and the converters, used for each row"""
+        importer = self.importer
+        description = self.fields_description
+        self.Model = self.anyblok.get(importer.model)
+        self.fields_converters = [
+            (
+                self.columns[field],
+                field,
+                importer.get_str2value(description[field]["type"]),
+            )
+            for field in self.header_fields
+        ]
+        self.pks_converters = [
+            (
+                self.columns[field],
+                field,
+                importer.get_str2value(description[field]["type"]),
+            )
+            for field in self.header_pks
+        ]
+        if self.header_external_id:
+            self.external_id_column = self.columns[self.header_external_id]
+
+        self.external_ids_converters = []
+        self.external_keys_converters = []
+        for external_field, field in self.header_external_ids.items():
+            ctype = description[field]["type"]
+            model = description[field]["model"]
+            converter = importer.get_str2value(
+                ctype,
+                external_id=True,
+                model=model,
+                fieldname=importer.get_fk_column(importer.model, field),
+            )
+            column = self.columns[external_field]
+            self.external_ids_converters.append((column, field, converter))
+            self.external_keys_converters.append(
+                (column, model, importer.get_str2external_ids(ctype))
+            )
+
+    def prefetch_external_ids(self, rows):
+        """Resolve in a batch all the external ids used by the rows"""
+        if self.external_keys_converters is None:
+            self.compile_converters()
+
+        keys_by_model = {}
+        if self.header_external_id:
+            column = self.external_id_column
+            keys_by_model[self.importer.model] = {
+                row[column] for row in rows if row[column]
+            }
+
+        for column, model, str2keys in self.external_keys_converters:
+            keys = keys_by_model.setdefault(model, set())
+            for row in rows:
+                try:
+                    keys.update(str2keys(row[column]))
+                except ValueError:
+                    # the error will be raised when the row is parsed
+                    pass
+
+        self.external_ids = self.importer.get_external_ids(keys_by_model)
+
+    def get_entry_key(self, pks):
+        return tuple(pks[field] for field in self.header_pks)
+
+    def prefetch_entries(self, rows):
+        """Load in one query the existing entries of the primary keys of the
+        rows, only if the header has got all the primary keys of the model"""
+        self.entries = None
+        Model = self.anyblok.get(self.importer.model)
+        if self.header_external_id or set(self.header_pks) != set(
+            Model.get_primary_keys()
+        ):
+            return
+
+        if self.pks_converters is None:
+            self.compile_converters()
+
+        pks = []
+        for row in rows:
+            try:
+                pks.append(
+                    {
+                        field: converter(row[column])
+                        for column, field, converter in self.pks_converters
+                    }
+                )
+            except Exception:
+                # the error will be raised when the row is parsed
+                pass
+
+        self.entries = {}
+        if pks:
+            query = Model.query().filter(
+                self.anyblok.IO.Mapping.filter_by_primary_keys(Model, *pks)
+            )
+            for entry in query.all():
+                key = self.get_entry_key(entry.to_primary_keys())
+                self.entries[key] = entry
+
+    def get_entry(self, Model, pks):
+        if self.entries is None:
+            return Model.from_primary_keys(**pks)
+
+        return self.entries.get(self.get_entry_key(pks))
+
+    def add_error(self, exception):
+        """Keep the error of the exception, and raise it now if the
+        importer asks for it
+
+        :param exception: exception raised by the import
+        :exception: CSVImporterException
+        """
+        msg = "%r: %r" % (exception.__class__.__name__, exception)
+        self.error_found.append(msg)
+        if self.importer.csv_on_error == "raise_now":
+            raise CSVImporterException(msg)
+
+    def set_mapping(self, key, entry):
+        """Save the mapping of the entry, during the run the mappings are
+        saved in one time at the end of the group of lines"""
+        self.external_ids[(self.importer.model, key)] = entry
+        if self.mappings_to_set is None:
+            self.anyblok.IO.Mapping.set(key, entry, blokname=self.blokname)
+        else:
+            self.mappings_to_set[key] = entry
+
+    def flush_mappings(self):
+        mappings = self.mappings_to_set
+        self.mappings_to_set = {}
+        if not mappings:
+            return
+
+        try:
+            self.anyblok.IO.Mapping.set_many(
+                self.importer.model,
+                [
+                    (key, entry.to_primary_keys())
+                    for key, entry in mappings.items()
+                ],
+                blokname=self.blokname,
+            )
+        except Exception as e:
+            self.add_error(e)
+
+    def use_bulk_insert(self):
+        """Return True if the rows can be inserted by group, only for the
+        header without external id, without primary key and without
+        relationship, the values of the relationships are entries which can
+        not be inserted by the ``INSERT`` statement"""
+        return (
+            self.importer.csv_bulk_insert
+            and self.importer.csv_if_does_not_exist == "create"
+            and not self.header_external_id
+            and not self.header_external_ids
+            and not self.header_pks
+            and not self.relationship_fields
+        )
+
+    def insert_values(self, Model, values):
+        """Insert the values and return the created entries, or only their
+        primary keys if the result mode does not keep the entries"""
+        Mapping = self.anyblok.IO.Mapping
+        stmt = insert(Model).values(values)
+        stmt = stmt.returning(
+            *[getattr(Model, pk).label(pk) for pk in Model.get_primary_keys()]
+        )
+        pks = [dict(row._mapping) for row in Model.execute_sql_statement(stmt)]
+        if self.importer.result_mode in ("primary_keys", "counts"):
+            # the entries would not be kept by the result
+            return pks
+
+        query = Model.query().filter(
+            Mapping.filter_by_primary_keys(Model, *pks)
+        )
+        entries = {
+            Mapping.hash_primary_keys(entry.to_primary_keys()): entry
+            for entry in query.all()
+        }
+        return [entries[Mapping.hash_primary_keys(x)] for x in pks]
+
+    def flush_inserts(self):
+        """Insert in one time the values of the group of lines, by one
+        ``INSERT ... RETURNING``
+
+        .. warning::
+
+            The ``INSERT`` statement does not call the ORM events
+        """
+        if not self.values_to_insert:
+            return
+
+        values, self.values_to_insert = self.values_to_insert, []
+        Model = self.anyblok.get(self.importer.model)
+        try:
+            self.created_entries.extend(self.insert_values(Model, values))
+        except Exception as e:
+            self.add_error(e)
+
+    def use_bulk_update(self):
+        """Return True if the existing entries are updated by group"""
+        return (
+            self.importer.csv_bulk_update
+            and self.importer.csv_if_exist == "overwrite"
+        )
+
+    def update_values(self, Model, columns, updates):
+        table = Model.__table__
+        pks = Model.get_primary_keys()
+        stmt = update(table).where(
+            *[table.c[pk] == bindparam("pk_" + pk) for pk in pks]
+        )
+        stmt = stmt.values(
+            {column: bindparam("value_" + column) for column in columns}
+        )
+        params = []
+        for entry, values in updates:
+            param = {
+                "pk_" + pk: value
+                for pk, value in entry.to_primary_keys().items()
+            }
+            param.update(
+                {"value_" + column: value for column, value in values.items()}
+            )
+            params.append(param)
+
+        Model.execute_sql_statement(stmt, params)
+        for entry, _ in updates:
+            self.anyblok.expire(entry, list(columns))
+
+    def flush_updates(self):
+        """Update in one time the entries of the group of lines, by one
+        executemany ``UPDATE`` by set of updated columns, the entries with
+        relationships are updated by the ORM
+
+        .. warning::
+
+            The ``UPDATE`` statement does not call the ORM events
+        """
+        if not self.values_to_update:
+            return
+
+        updates, self.values_to_update = self.values_to_update, []
+        Model = self.anyblok.get(self.importer.model)
+        groups = {}
+        for entry, values in updates:
+            columns = tuple(sorted(values))
+            groups.setdefault(columns, []).append((entry, values))
+
+        try:
+            for columns, group in groups.items():
+                if self.relationship_fields.intersection(columns):
+                    for entry, values in group:
+                        entry.update(**values)
+                elif columns:
+                    self.update_values(Model, columns, group)
+
+            self.updated_entries.extend(entry for entry, _ in updates)
+        except Exception as e:
+            self.add_error(e)
+
+    def flush_rows(self):
+        """Write the updates, the creations and the mappings kept during
+        the parse of the group of lines"""
+        self.flush_updates()
+        self.flush_inserts()
+        self.flush_mappings()
+
     def _parse_row_if_entry(self, row, entry, values, Model):
         if self.importer.csv_if_exist == "overwrite":
-            entry.update(**values)
-            self.updated_entries.append(entry)
+            if self.importer.skip_unchanged and self.importer.is_unchanged(
+                entry, values
+            ):
+                self.unchanged += 1
+            elif self.values_to_update is not None:
+                self.values_to_update.append((entry, values))
+            else:
+                entry.update(**values)
+                self.updated_entries.append(entry)
         elif self.importer.csv_if_exist == "create":
             entry = Model.insert(**values)
             self.created_entries.append(entry)
@@ -143,17 +518,20 @@ class CSV:
             )
 
     def _parse_row_if_not_entry(self, row, pks, values, Model):
-        Mapping = self.anyblok.IO.Mapping
         if self.importer.csv_if_does_not_exist == "create":
             if pks:
                 values.update(**pks)
 
+            if self.values_to_insert is not None:
+                self.values_to_insert.append(values)
+                return
+
             entry = Model.insert(**values)
             self.created_entries.append(entry)
             if self.header_external_id:
-                Mapping.set(
-                    row[self.header_external_id], entry, blokname=self.blokname
-                )
+                self.set_mapping(row[self.external_id_column], entry)
+            elif self.entries is not None:
+                self.entries[self.get_entry_key(pks)] = entry
 
         elif self.importer.csv_if_does_not_exist == "raise":
             raise CSVImporterException("Create row are not allowed")
@@ -167,61 +545,70 @@ class CSV:
     def parse_row(self, row):
         try:
             entry = pks = None
-            Model = self.anyblok.get(self.importer.model)
+            if self.fields_converters is None:
+                self.compile_converters()
+
+            Model = self.Model
+
             values = {}
-            for field in self.header_fields:
-                ctype = self.fields_description[field]["type"]
-                values[field] = self.importer.str2value(row[field], ctype)
-
-            for external_field, field in self.header_external_ids.items():
-                ctype = self.fields_description[field]["type"]
-                model = self.fields_description[field]["model"]
-                mapper = ModelAttribute(self.importer.model, field)
-                fieldname = mapper.get_fk_column(self.anyblok)
-                values[field] = self.importer.str2value(
-                    row[external_field],
-                    ctype,
-                    external_id=True,
-                    model=model,
-                    fieldname=fieldname,
+            for column, field, converter in self.fields_converters:
+                values[field] = converter(row[column])
+
+            for column, field, converter in self.external_ids_converters:
+                values[field] = converter(
+                    row[column], external_ids=self.external_ids
                 )
 
             if self.header_external_id:
-                entry = self.importer.get_key_mapping(
-                    row[self.header_external_id]
-                )
+                key = row[self.external_id_column]
+                if (self.importer.model, key) in self.external_ids:
+                    entry = self.external_ids[(self.importer.model, key)]
+                else:
+                    entry = self.importer.get_key_mapping(key)
             elif self.header_pks:
-                pks = {}
-                for field in self.header_pks:
-                    ctype = self.fields_description[field]["type"]
-                    pks[field] = self.importer.str2value(row[field], ctype)
+                pks = {
+                    field: converter(row[column])
+                    for column, field, converter in self.pks_converters
+                }
 
-                entry = Model.from_primary_keys(**pks)
+                entry = self.get_entry(Model, pks)
 
             self._parse_row(row, entry, pks, values, Model)
         except Exception as e:
-            msg = "%r: %r" % (e.__class__.__name__, e)
-            self.error_found.append(msg)
-            if self.importer.csv_on_error == "raise_now":
-                raise CSVImporterException(msg)
+            self.add_error(e)
 
     def run(self):
         try:
             self.get_reader()
             self.get_header()
             self.consume_offset()
+            self.mappings_to_set = {}
+            if self.use_bulk_insert():
+                self.values_to_insert = []
+
+            if self.use_bulk_update():
+                self.values_to_update = []
+
             while True:
                 rows = self.consume_nb_grouped_lines()
                 if not rows:
                     break
 
+                self.prefetch_external_ids(rows)
+                self.prefetch_entries(rows)
                 for row in rows:
                     self.parse_row(row)
 
+                self.flush_rows()
                 self.commit()
         except Exception as e:
             msg = "%r: %r" % (e.__class__.__name__, e)
             self.error_found.append(msg)
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+        self.importer.flush_results(self)
 
         if self.error_found:
             if self.importer.csv_on_error == "raise_at_the_end":
@@ -232,6 +619,9 @@ class CSV:
             "error": self.error_found,
             "created_entries": self.created_entries,
             "updated_entries": self.updated_entries,
+            "nb_created_entries": self.nb_created_entries,
+            "nb_updated_entries": self.nb_updated_entries,
+            "unchanged": self.unchanged,
         }
 
     @classmethod
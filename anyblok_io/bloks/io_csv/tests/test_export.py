@@ -114,6 +114,17 @@ class TestExportCSV:
         res = exporter.fields_to_export[0].value2str(exporter, exporter)
         assert res == key
 
+    def test_get_value2str_reused_for_the_entries(self):
+        Exporter = self.registry.IO.Exporter
+        fields = [{"name": "model.name"}]
+        exporter = self.create_exporter(Exporter, fields=fields)
+        other = self.create_exporter(Exporter)
+        value2str = exporter.fields_to_export[0].get_value2str(
+            exporter, "Model.IO.Exporter"
+        )
+        assert value2str(exporter) == "Model.IO.Exporter"
+        assert value2str(other) == "Model.IO.Exporter"
+
     def test_format_browsed_field_with_mapping_Many2One(self):
         Field = self.registry.IO.Exporter.Field
         fields = [{"name": "exporter.id", "mode": "external_id"}]
@@ -5,11 +5,12 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
-from csv import DictReader
+from csv import reader, writer
 from io import StringIO
 from os import urandom
 
 import pytest
+from sqlalchemy import event
 
 from ..exceptions import CSVImporterException
 
@@ -50,7 +51,7 @@ class TestImportCSV:
     def test_commit(self):
         importer = self.create_csv_importer()
         csvfile = StringIO()
-        importer.reader = DictReader(csvfile)
+        importer.reader = reader(csvfile)
         assert importer.commit() is True
 
     def test_get_reader(self):
@@ -58,7 +59,66 @@ class TestImportCSV:
             file_to_import=self.get_file_to_import()
         )
         importer.get_reader()
-        assert isinstance(importer.reader, DictReader) is True
+        assert importer.headers == ["A", "B", "C"]
+        assert next(importer.reader) == ["1", "2", "3"]
+
+    def test_get_reader_with_encoding(self):
+        importer = self.create_csv_importer(
+            csv_encoding="latin-1",
+            file_to_import='''"A","B"\n"é","à"'''.encode("latin-1"),
+        )
+        importer.get_reader()
+        assert importer.headers == ["A", "B"]
+        assert next(importer.reader) == ["é", "à"]
+
+    def test_get_reader_keeps_the_newline_in_quoted_value(self):
+        importer = self.create_csv_importer(
+            file_to_import=b'"A","B"\r\n"1\r\n2","3"\r\n"4","5"'
+        )
+        importer.get_reader()
+        assert next(importer.reader) == ["1\r\n2", "3"]
+        assert next(importer.reader) == ["4", "5"]
+        assert importer.reader.line_num == 4
+
+    def get_multiline_file_to_import(self):
+        return b'"A","B"\n"1","2\n3"\n"4","5"\n'
+
+    def test_commit_saves_the_position(self):
+        importer = self.create_csv_importer(
+            nb_grouped_lines=1,
+            commit_at_each_grouped=False,
+            file_to_import=self.get_multiline_file_to_import(),
+        )
+        importer.get_reader()
+        assert importer.consume_nb_grouped_lines() == [["1", "2\n3"]]
+        assert importer.commit() is True
+        assert importer.importer.offset == 2
+        assert importer.importer.csv_offset_line_num == 3
+        assert importer.importer.csv_offset_position == 18
+
+    def test_consume_offset_seek_the_position(self):
+        importer = self.create_csv_importer(
+            offset=2,
+            csv_offset_line_num=3,
+            csv_offset_position=18,
+            file_to_import=self.get_multiline_file_to_import(),
+        )
+        importer.get_reader()
+        importer.consume_offset()
+        assert importer.read_row() == ["4", "5"]
+        assert importer.line_num_base + importer.reader.line_num == 4
+
+    def test_consume_offset_without_the_position_of_the_offset(self):
+        importer = self.create_csv_importer(
+            offset=1,
+            csv_offset_line_num=3,
+            csv_offset_position=18,
+            file_to_import=self.get_multiline_file_to_import(),
+        )
+        importer.get_reader()
+        importer.consume_offset()
+        assert importer.line_num_base == 0
+        assert importer.read_row() == ["4", "5"]
 
     def assertNbLines(self, importer, nb_line_wanted):
         rows = [row for row in importer.reader]
@@ -103,10 +163,10 @@ class TestImportCSV:
         importer.get_reader()
         rows = importer.consume_nb_grouped_lines()
         assert len(rows) == 1
-        assert rows[0] == {"A": "1", "B": "2", "C": "3"}
+        assert rows[0] == ["1", "2", "3"]
         rows = importer.consume_nb_grouped_lines()
         assert len(rows) == 1
-        assert rows[0] == {"A": "4", "B": "5", "C": "6"}
+        assert rows[0] == ["4", "5", "6"]
 
     def test_consume_nb_grouped_lines_same_number(self):
         importer = self.create_csv_importer(
@@ -115,8 +175,8 @@ class TestImportCSV:
         importer.get_reader()
         rows = importer.consume_nb_grouped_lines()
         assert len(rows) == 2
-        assert rows[0] == {"A": "1", "B": "2", "C": "3"}
-        assert rows[1] == {"A": "4", "B": "5", "C": "6"}
+        assert rows[0] == ["1", "2", "3"]
+        assert rows[1] == ["4", "5", "6"]
 
     def test_consume_nb_group_lines_greater_than_nb_lines(self):
         importer = self.create_csv_importer(
@@ -125,8 +185,8 @@ class TestImportCSV:
         importer.get_reader()
         rows = importer.consume_nb_grouped_lines()
         assert len(rows) == 2
-        assert rows[0] == {"A": "1", "B": "2", "C": "3"}
-        assert rows[1] == {"A": "4", "B": "5", "C": "6"}
+        assert rows[0] == ["1", "2", "3"]
+        assert rows[1] == ["4", "5", "6"]
 
     def get_exporter_file_to_import(self, withmapping=False):
         if not withmapping:
@@ -289,76 +349,98 @@ class TestImportCSV:
         assert "model" not in importer.header_fields
         assert "mode" in importer.header_fields
 
-    def test_parse_row_on_error_raise(self):
-        Importer = self.registry.IO.Importer
+    def test_get_header_compile_the_converters(self):
+        importer = self.create_csv_importer(
+            file_to_import=self.get_exporter_file_to_import(withmapping=True)
+        )
+        importer.get_reader()
+        importer.get_header()
+        assert importer.Model is self.registry.IO.Importer
+        assert [x[:2] for x in importer.fields_converters] == [(1, "mode")]
+        assert importer.external_ids_converters[0][:2] == (0, "model")
+
+    def test_add_error(self):
+        importer = self.create_csv_importer(model="Model.IO.Exporter")
+        importer.add_error(ValueError("wrong value"))
+        assert importer.error_found == [
+            "'ValueError': ValueError('wrong value')"
+        ]
+
+    def test_add_error_raise_now(self):
         importer = self.create_csv_importer(
             model="Model.IO.Exporter", csv_on_error="raise_now"
         )
-        importer.header_fields = ["model", "mode"]
-        importer.fields_description = Importer.fields_description(
-            fields=importer.header_fields
+        with pytest.raises(CSVImporterException):
+            importer.add_error(ValueError("wrong value"))
+
+        assert len(importer.error_found) == 1
+
+    def create_csv_importer_with_rows(self, header, *rows, **kwargs):
+        """Return the CSV importer with the header got, and the rows read by
+        the reader of the importer"""
+        csvfile = StringIO()
+        writer(csvfile).writerows([header, *rows])
+        importer = self.create_csv_importer(
+            file_to_import=csvfile.getvalue().encode("utf-8"), **kwargs
+        )
+        importer.get_reader()
+        importer.get_header()
+        return importer, [importer.read_row() for row in rows]
+
+    def test_parse_row_on_error_raise(self):
+        importer, rows = self.create_csv_importer_with_rows(
+            ["id", "model", "mode"],
+            ["wrong id", "Model.IO.Exporter", "Model.IO.Exporter.CSV"],
+            model="Model.IO.Exporter",
+            csv_on_error="raise_now",
         )
         with pytest.raises(CSVImporterException):
-            importer.parse_row({"mode": "Model.IO.Exporter.CSV"})
+            importer.parse_row(rows[0])
 
     def test_parse_row(self):
-        Importer = self.registry.IO.Importer
-        importer = self.create_csv_importer(model="Model.IO.Exporter")
-        importer.header_fields = ["model", "mode"]
-        importer.fields_description = Importer.fields_description(
-            fields=importer.header_fields
-        )
-        importer.parse_row(
-            {"model": "Model.IO.Importer", "mode": "Model.IO.Exporter.CSV"}
+        importer, rows = self.create_csv_importer_with_rows(
+            ["model", "mode"],
+            ["Model.IO.Importer", "Model.IO.Exporter.CSV"],
+            model="Model.IO.Exporter",
         )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 1
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 0
 
     def test_parse_row_with_raise(self):
-        Importer = self.registry.IO.Importer
-        importer = self.create_csv_importer(
-            model="Model.IO.Exporter", csv_if_does_not_exist="raise"
-        )
-        importer.header_fields = ["model", "mode"]
-        importer.fields_description = Importer.fields_description(
-            fields=importer.header_fields
-        )
-        importer.parse_row(
-            {"model": "Model.IO.Importer", "mode": "Model.IO.Exporter.CSV"}
+        importer, rows = self.create_csv_importer_with_rows(
+            ["model", "mode"],
+            ["Model.IO.Importer", "Model.IO.Exporter.CSV"],
+            model="Model.IO.Exporter",
+            csv_if_does_not_exist="raise",
         )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 0
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 1
 
     def test_parse_row_with_pass(self):
-        Importer = self.registry.IO.Importer
-        importer = self.create_csv_importer(
-            model="Model.IO.Exporter", csv_if_does_not_exist="pass"
-        )
-        importer.header_fields = ["model", "mode"]
-        importer.fields_description = Importer.fields_description(
-            fields=importer.header_fields
-        )
-        importer.parse_row(
-            {"model": "Model.IO.Importer", "mode": "Model.IO.Exporter.CSV"}
+        importer, rows = self.create_csv_importer_with_rows(
+            ["model", "mode"],
+            ["Model.IO.Importer", "Model.IO.Exporter.CSV"],
+            model="Model.IO.Exporter",
+            csv_if_does_not_exist="pass",
         )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 0
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 0
 
     def test_parse_row_with_existing_pks_update(self):
         Model = self.registry.System.Model
-        importer = self.create_csv_importer(model="Model.System.Model")
-        importer.header_pks = ["name"]
-        importer.header_fields = ["table"]
-        importer.fields_description = Model.fields_description(
-            fields=["name", "table"]
+        importer, rows = self.create_csv_importer_with_rows(
+            ["name", "table"],
+            ["Model.IO.Test", "io_test_other_table"],
+            model="Model.System.Model",
         )
         Model.insert(name="Model.IO.Test", table="io_test")
-        importer.parse_row(
-            {"name": "Model.IO.Test", "table": "io_test_other_table"}
-        )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 0
         assert len(importer.updated_entries) == 1
         assert len(importer.error_found) == 0
@@ -366,113 +448,79 @@ class TestImportCSV:
 
     def test_parse_row_with_existing_pks_create(self):
         Exporter = self.registry.IO.Exporter
-        importer = self.create_csv_importer(
-            model="Model.IO.Exporter", csv_if_exist="create"
-        )
-        importer.header_pks = ["id"]
-        importer.header_fields = ["model", "mode"]
-        importer.fields_description = Exporter.fields_description(
-            fields=["id", "model", "mode"]
-        )
         exporter = Exporter.CSV.insert(model="Model.IO.Importer")
-        importer.parse_row(
-            {
-                "id": str(exporter.id),
-                "model": "Model.System.Model",
-                "mode": "Model.IO.Exporter.CSV",
-            }
+        importer, rows = self.create_csv_importer_with_rows(
+            ["id", "model", "mode"],
+            [str(exporter.id), "Model.System.Model", "Model.IO.Exporter.CSV"],
+            model="Model.IO.Exporter",
+            csv_if_exist="create",
         )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 1
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 0
 
     def test_parse_row_with_existing_pks_pass(self):
         Model = self.registry.System.Model
-        importer = self.create_csv_importer(
-            model="Model.System.Model", csv_if_exist="pass"
-        )
-        importer.header_pks = ["name"]
-        importer.header_fields = ["table"]
-        importer.fields_description = Model.fields_description(
-            fields=["name", "table"]
+        importer, rows = self.create_csv_importer_with_rows(
+            ["name", "table"],
+            ["Model.IO.Test", "io_test_other_table"],
+            model="Model.System.Model",
+            csv_if_exist="pass",
         )
         Model.insert(name="Model.IO.Test", table="io_test")
-        importer.parse_row(
-            {"name": "Model.IO.Test", "table": "io_test_other_table"}
-        )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 0
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 0
 
     def test_parse_row_with_existing_pks_raise(self):
         Model = self.registry.System.Model
-        importer = self.create_csv_importer(
-            model="Model.System.Model", csv_if_exist="raise"
-        )
-        importer.header_pks = ["name"]
-        importer.header_fields = ["table"]
-        importer.fields_description = Model.fields_description(
-            fields=["name", "table"]
+        importer, rows = self.create_csv_importer_with_rows(
+            ["name", "table"],
+            ["Model.IO.Test", "io_test_other_table"],
+            model="Model.System.Model",
+            csv_if_exist="raise",
         )
         Model.insert(name="Model.IO.Test", table="io_test")
-        importer.parse_row(
-            {"name": "Model.IO.Test", "table": "io_test_other_table"}
-        )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 0
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 1
 
     def test_parse_row_with_unexting_multi_pks(self):
-        Column = self.registry.System.Column
-        importer = self.create_csv_importer(model="Model.System.Column")
-        importer.header_pks = ["name", "model"]
-        importer.header_fields = ["nullable"]
-        importer.fields_description = Column.fields_description(
-            fields=["name", "model", "nullable"]
-        )
-        importer.parse_row(
-            {"name": "test", "model": "Model.System.Model", "nullable": True}
+        importer, rows = self.create_csv_importer_with_rows(
+            ["name", "model", "nullable"],
+            ["test", "Model.System.Model", "1"],
+            model="Model.System.Column",
         )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 1
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 0
 
     def test_parse_row_with_mapping_pks(self):
         Model = self.registry.System.Model
-        importer = self.create_csv_importer(model="Model.System.Model")
-        importer.header_external_id = "name/EXTERNAL_ID"
-        importer.header_fields = ["table"]
-        importer.fields_description = Model.fields_description(
-            fields=["name", "table"]
+        importer, rows = self.create_csv_importer_with_rows(
+            ["name/EXTERNAL_ID", "table"],
+            ["import_mapping", "io_test_other_table"],
+            model="Model.System.Model",
         )
         model = Model.insert(name="Model.IO.Test", table="io_test")
         self.registry.IO.Mapping.set("import_mapping", model)
-        importer.parse_row(
-            {
-                "name/EXTERNAL_ID": "import_mapping",
-                "table": "io_test_other_table",
-            }
-        )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 0
         assert len(importer.updated_entries) == 1
         assert len(importer.error_found) == 0
         assert importer.updated_entries[0].table == "io_test_other_table"
 
     def test_parse_row_with_unexisting_mapping_pks(self):
-        Exporter = self.registry.IO.Exporter
-        importer = self.create_csv_importer(model="Model.IO.Exporter")
-        importer.header_external_id = "id/EXTERNAL_ID"
-        importer.header_fields = ["model", "mode"]
-        importer.fields_description = Exporter.fields_description(
-            fields=["id", "model", "mode"]
-        )
-        importer.parse_row(
-            {
-                "id/EXTERNAL_ID": "import_mapping",
-                "model": "Model.IO.Exporter",
-                "mode": "Model.IO.Exporter.CSV",
-            }
+        importer, rows = self.create_csv_importer_with_rows(
+            ["id/EXTERNAL_ID", "model", "mode"],
+            ["import_mapping", "Model.IO.Exporter", "Model.IO.Exporter.CSV"],
+            model="Model.IO.Exporter",
         )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 1
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 0
@@ -485,45 +533,95 @@ class TestImportCSV:
     def test_parse_row_with_mapping(self):
         Model = self.registry.System.Model
         model = Model.insert(name="Model.IO.Test", table="io_test")
-        Importer = self.registry.IO.Importer
-        importer = self.create_csv_importer(model="Model.IO.Exporter")
         exporter = self.registry.IO.Exporter.CSV.insert(
             model="Model.IO.Exporter"
         )
-        importer.header_pks = ["id"]
-        importer.header_external_ids = {"model/EXTERNAL_ID": "model"}
-        importer.header_fields = ["mode"]
-        importer.fields_description = Importer.fields_description(
-            fields=["id", "model", "mode"]
-        )
         self.registry.IO.Mapping.set("import_mapping", model)
-        importer.parse_row(
-            {
-                "id": str(exporter.id),
-                "model/EXTERNAL_ID": "import_mapping",
-                "mode": "Model.IO.Exporter.CSV",
-            }
+        importer, rows = self.create_csv_importer_with_rows(
+            ["id", "model/EXTERNAL_ID", "mode"],
+            [str(exporter.id), "import_mapping", "Model.IO.Exporter.CSV"],
+            model="Model.IO.Exporter",
         )
+        importer.parse_row(rows[0])
         assert len(importer.created_entries) == 0
         assert len(importer.updated_entries) == 1
         assert len(importer.error_found) == 0
         assert importer.updated_entries[0].model == "Model.IO.Test"
 
+    def test_prefetch_external_ids(self):
+        Model = self.registry.System.Model
+        model = Model.insert(name="Model.IO.Test", table="io_test")
+        self.registry.IO.Mapping.set("import_mapping", model)
+        importer, rows = self.create_csv_importer_with_rows(
+            ["id/EXTERNAL_ID", "model/EXTERNAL_ID"],
+            ["importer", ""],
+            ["", "import_mapping"],
+            model="Model.IO.Importer",
+        )
+        importer.prefetch_external_ids(rows)
+        assert importer.external_ids == {
+            ("Model.IO.Importer", "importer"): None,
+            ("Model.System.Model", "import_mapping"): model,
+        }
+
+    def test_compile_converters(self):
+        importer, rows = self.create_csv_importer_with_rows(
+            ["id", "model/EXTERNAL_ID", "mode", "offset"],
+            model="Model.IO.Importer",
+        )
+        importer.compile_converters()
+        assert [x[:2] for x in importer.fields_converters] == [
+            (2, "mode"),
+            (3, "offset"),
+        ]
+        assert importer.fields_converters[1][2]("10") == 10
+        assert importer.pks_converters[0][:2] == (0, "id")
+        assert importer.pks_converters[0][2]("1") == 1
+        assert importer.external_ids_converters[0][:2] == (1, "model")
+        assert importer.external_keys_converters[0][:2] == (
+            1,
+            "Model.System.Model",
+        )
+
+    def test_read_row(self):
+        importer = self.create_csv_importer(
+            file_to_import='''"A","B","C"\n\n"1","2"\n"4","5","6"'''.encode(
+                "utf-8"
+            )
+        )
+        importer.get_reader()
+        assert importer.read_row() == ["1", "2", None]
+        assert importer.reader.line_num == 3
+        assert importer.read_row() == ["4", "5", "6"]
+
+    def test_compile_converters_with_header_indexes(self):
+        importer = self.create_csv_importer(
+            model="Model.IO.Importer",
+            file_to_import='''"offset","id","mode"\n"1","2","3"'''.encode(
+                "utf-8"
+            ),
+        )
+        importer.get_reader()
+        importer.get_header()
+        importer.compile_converters()
+        assert importer.columns == {"offset": 0, "id": 1, "mode": 2}
+        assert [x[:2] for x in importer.fields_converters] == [
+            (0, "offset"),
+            (2, "mode"),
+        ]
+        assert importer.pks_converters[0][:2] == (1, "id")
+
     def test_parse_row_with_unexisting_mapping(self):
-        Importer = self.registry.IO.Importer
-        importer = self.create_csv_importer(model="Model.IO.Importer")
-        importer.header_pks = ["id"]
-        importer.header_external_ids = {"model/EXTERNAL_ID": "model"}
-        importer.header_fields = ["mode"]
-        importer.fields_description = Importer.fields_description(
-            fields=["id", "model", "mode"]
+        importer, rows = self.create_csv_importer_with_rows(
+            ["id", "model/EXTERNAL_ID", "mode"],
+            model="Model.IO.Importer",
         )
         importer.parse_row(
-            {
-                "id": str(importer.importer.id),
-                "model/EXTERNAL_ID": "import_mapping",
-                "mode": "Model.IO.Importer.CSV",
-            }
+            [
+                str(importer.importer.id),
+                "import_mapping",
+                "Model.IO.Importer.CSV",
+            ]
         )
         assert len(importer.created_entries) == 0
         assert len(importer.updated_entries) == 0
@@ -539,6 +637,308 @@ class TestImportCSV:
         assert len(importer.updated_entries) == 0
         assert len(importer.error_found) == 0
 
+    def test_run_with_mapping(self):
+        file_to_import = "\n".join(
+            [
+                "id/EXTERNAL_ID,model,mode",
+                "exporter1,Model.IO.Exporter,Model.IO.Exporter.CSV",
+                "exporter2,Model.IO.Exporter,Model.IO.Exporter.CSV",
+                "exporter1,Model.IO.Importer,Model.IO.Exporter.CSV",
+            ]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        importer = CSV(
+            self.create_importer(
+                model="Model.IO.Exporter",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+            ),
+            blokname="anyblok-io",
+        )
+        importer.run()
+        assert len(importer.created_entries) == 2
+        assert len(importer.updated_entries) == 1
+        assert len(importer.error_found) == 0
+        Mapping = self.registry.IO.Mapping
+        exporter1 = Mapping.get("Model.IO.Exporter", "exporter1")
+        exporter2 = Mapping.get("Model.IO.Exporter", "exporter2")
+        assert importer.created_entries == [exporter1, exporter2]
+        assert exporter1.model == "Model.IO.Importer"
+        assert Mapping.get_from_entry(exporter1).blokname == "anyblok-io"
+
+    def test_prefetch_entries(self):
+        Column = self.registry.System.Column
+        importer, rows = self.create_csv_importer_with_rows(
+            ["model", "name", "nullable"],
+            ["Model.System.Blok", "name", "1"],
+            ["Model.System.Blok", "unknown", "1"],
+            model="Model.System.Column",
+        )
+        importer.prefetch_entries(rows)
+        column = Column.from_primary_keys(
+            model="Model.System.Blok", name="name"
+        )
+        assert importer.entries == {("Model.System.Blok", "name"): column}
+
+    def test_prefetch_entries_without_all_the_pks(self):
+        importer, rows = self.create_csv_importer_with_rows(
+            ["name"], ["name"], model="Model.System.Column"
+        )
+        importer.prefetch_entries(rows)
+        assert importer.entries is None
+
+    def test_run_with_pks(self):
+        file_to_import = "\n".join(
+            [
+                "name,table",
+                "Model.System.Blok,system_blok_other",
+                "Model.IO.Test,io_test",
+                "Model.IO.Test,io_test_other",
+            ]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        importer = CSV(
+            self.create_importer(
+                model="Model.System.Model",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+            )
+        )
+        importer.run()
+        Model = self.registry.System.Model
+        assert len(importer.error_found) == 0
+        assert importer.created_entries == [
+            Model.from_primary_keys(name="Model.IO.Test")
+        ]
+        assert len(importer.updated_entries) == 2
+        assert importer.created_entries[0].table == "io_test_other"
+        blok = Model.from_primary_keys(name="Model.System.Blok")
+        assert blok.table == "system_blok_other"
+
+    def test_run_from_file_path(self, tmp_path):
+        path = tmp_path / "file.csv"
+        path.write_bytes(self.get_exporter_file_to_import())
+        importer = self.create_csv_importer(
+            model="Model.IO.Exporter", file_path=str(path)
+        )
+        res = importer.run()
+        assert res["error"] == []
+        assert len(res["created_entries"]) == 1
+        assert importer.file.closed
+
+    def test_run_with_bulk_insert(self):
+        file_to_import = "\n".join(
+            [
+                "model,mode",
+                "Model.IO.Exporter,Model.IO.Exporter.CSV",
+                "Model.IO.Importer,Model.IO.Exporter.CSV",
+            ]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        importer = CSV(
+            self.create_importer(
+                model="Model.IO.Exporter",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+                csv_bulk_insert=True,
+            )
+        )
+        assert importer.run()["error"] == []
+        assert [x.model for x in importer.created_entries] == [
+            "Model.IO.Exporter",
+            "Model.IO.Importer",
+        ]
+
+    def test_run_with_bulk_insert_and_primary_keys(self):
+        file_to_import = "\n".join(
+            [
+                "model,mode",
+                "Model.IO.Exporter,Model.IO.Exporter.CSV",
+                "Model.IO.Importer,Model.IO.Exporter.CSV",
+            ]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        importer = CSV(
+            self.create_importer(
+                model="Model.IO.Exporter",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+                csv_bulk_insert=True,
+                result_mode="primary_keys",
+            )
+        )
+        selects = []
+
+        def log_selects(conn, cursor, statement, *args):
+            if statement.startswith("SELECT") and "FROM io_exporter" in (
+                statement
+            ):
+                selects.append(statement)
+
+        engine = self.registry.engine
+        event.listen(engine, "before_cursor_execute", log_selects)
+        try:
+            res = importer.run()
+        finally:
+            event.remove(engine, "before_cursor_execute", log_selects)
+
+        assert res["error"] == []
+        assert selects == []
+        Exporter = self.registry.IO.Exporter
+        assert [
+            Exporter.from_primary_keys(**x).model
+            for x in res["created_entries"]
+        ] == ["Model.IO.Exporter", "Model.IO.Importer"]
+
+    def test_run_with_bulk_insert_and_external_ids(self):
+        exporter = self.registry.IO.Exporter.insert(
+            model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+        )
+        self.registry.IO.Mapping.set("exporter", exporter)
+        file_to_import = "\n".join(
+            ["exporter/EXTERNAL_ID,name", "exporter,model", "exporter,mode"]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        importer = CSV(
+            self.create_importer(
+                model="Model.IO.Exporter.Field",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+                csv_bulk_insert=True,
+            )
+        )
+        importer.get_reader()
+        importer.get_header()
+        assert not importer.use_bulk_insert()
+        importer = CSV(importer.importer)
+        assert importer.run()["error"] == []
+        assert [(x.exporter, x.name) for x in importer.created_entries] == [
+            (exporter, "model"),
+            (exporter, "mode"),
+        ]
+
+    def test_run_with_counts_and_callback(self):
+        file_to_import = "\n".join(
+            [
+                "model,mode",
+                "Model.IO.Exporter,Model.IO.Exporter.CSV",
+                "Model.IO.Importer,Model.IO.Exporter.CSV",
+            ]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        batches = []
+        importer = CSV(
+            self.create_importer(
+                model="Model.IO.Exporter",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+                nb_grouped_lines=1,
+                result_mode="counts",
+            ),
+            callback=lambda created, updated: batches.append(
+                ([x.model for x in created], updated)
+            ),
+        )
+        res = importer.run()
+        assert res["created_entries"] == []
+        assert res["nb_created_entries"] == 2
+        assert res["nb_updated_entries"] == 0
+        assert batches == [
+            (["Model.IO.Exporter"], []),
+            (["Model.IO.Importer"], []),
+        ]
+
+    def test_run_with_bulk_update(self):
+        file_to_import = "\n".join(
+            [
+                "name,table",
+                "Model.System.Blok,system_blok_other",
+                "Model.System.Column,system_column_other",
+                "Model.IO.Test,io_test",
+            ]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        importer = CSV(
+            self.create_importer(
+                model="Model.System.Model",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+                csv_bulk_update=True,
+            )
+        )
+        assert importer.run()["error"] == []
+        Model = self.registry.System.Model
+        blok = Model.from_primary_keys(name="Model.System.Blok")
+        column = Model.from_primary_keys(name="Model.System.Column")
+        assert importer.updated_entries == [blok, column]
+        assert blok.table == "system_blok_other"
+        assert column.table == "system_column_other"
+        assert len(importer.created_entries) == 1
+
+    def test_run_with_bulk_update_and_external_ids(self):
+        Exporter = self.registry.IO.Exporter
+        exporter1 = Exporter.insert(
+            model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+        )
+        exporter2 = Exporter.insert(
+            model="Model.IO.Exporter", mode="Model.IO.Exporter.CSV"
+        )
+        self.registry.IO.Mapping.set("exporter2", exporter2)
+        field1 = Exporter.Field.insert(exporter=exporter1, name="model")
+        field2 = Exporter.Field.insert(exporter=exporter1, name="mode")
+        file_to_import = "\n".join(
+            [
+                "id,exporter/EXTERNAL_ID,name",
+                "%d,exporter2,model" % field1.id,
+                "%d,exporter2,mapping" % field2.id,
+            ]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        importer = CSV(
+            self.create_importer(
+                model="Model.IO.Exporter.Field",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+                csv_bulk_update=True,
+            )
+        )
+        assert importer.run()["error"] == []
+        assert importer.updated_entries == [field1, field2]
+        assert (field1.exporter, field1.name) == (exporter2, "model")
+        assert (field2.exporter, field2.name) == (exporter2, "mapping")
+
+    def test_run_skip_unchanged(self):
+        Model = self.registry.System.Model
+        blok = Model.from_primary_keys(name="Model.System.Blok")
+        column = Model.from_primary_keys(name="Model.System.Column")
+        file_to_import = "\n".join(
+            [
+                "name,table",
+                "Model.System.Blok,%s" % blok.table,
+                "Model.System.Column,system_column_other",
+            ]
+        )
+        CSV = self.registry.IO.Importer.CSV
+        importer = CSV(
+            self.create_importer(
+                model="Model.System.Model",
+                file_to_import=file_to_import.encode("utf-8"),
+                commit_at_each_grouped=False,
+                skip_unchanged=True,
+            )
+        )
+        res = importer.run()
+        assert res["error"] == []
+        assert res["updated_entries"] == [column]
+        assert res["unchanged"] == 1
+
+    def test_use_bulk_insert_with_pks(self):
+        importer = self.create_csv_importer(
+            model="Model.System.Model", csv_bulk_insert=True
+        )
+        importer.header_pks = ["name"]
+        assert not importer.use_bulk_insert()
+
     def test_run_raise_at_end(self):
         importer = self.create_csv_importer()
         with pytest.raises(CSVImporterException):
@@ -10,13 +10,7 @@ from anyblok.release import version
 
 
 class AnyBlokIOXML(Blok):
-    """XML Importer / Exporter behaviour
-
-    .. warning::
-
-        Importer and Exporter are not implemented yet
-
-    """
+    """XML Importer / Exporter behaviour"""
 
     version = version
     author = "Suzanne Jean-Sébastien"
@@ -5,10 +5,15 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+from io import BytesIO
+
 from anyblok import Declarations
+from lxml import etree
 
 register = Declarations.register
 IO = Declarations.Model.IO
+X2MANY_TYPES = ("One2Many", "Many2Many")
+RELATIONSHIP_TYPES = ("Many2One", "One2One") + X2MANY_TYPES
 
 
 @register(IO)
@@ -24,6 +29,7 @@ class Exporter:
 class XML:
     def __init__(self, exporter):
         self.exporter = exporter
+        self.sub_fields = {}
 
     @classmethod
     def insert(cls, delimiter=None, quotechar=None, fields=None, **kwargs):
@@ -34,5 +40,126 @@ class XML:
 
         return cls.anyblok.IO.Exporter.insert(**kwargs)
 
-    def run(self, entries):
-        raise NotImplementedError
+    def get_fields(self, fields=None, model=None):
+        """Return the exported fields of the model, with their converter
+        got only one time by export. The functions, the columns of the
+        foreign keys (exported by their relationship) and the autoincrement
+        primary key (the record has got an external id) are not exported
+
+        :param fields: names of the fields to export, all the fields if empty
+        :param model: registry name of the model, by default the model of
+                      the exporter
+        :rtype: list of tuple (name, type, model, converter)
+        """
+        Model = self.anyblok.get(model or self.exporter.model)
+        table = getattr(Model, "__table__", None)
+        autoincrement = set()
+        if table is not None:
+            autoincrement = {
+                column.name
+                for column in table.primary_key.columns
+                if column.autoincrement is True
+            }
+
+        res = []
+        for name, description in Model.fields_description(fields).items():
+            ctype = description["type"]
+            if ctype in ("Function", "FakeColumn") or name in autoincrement:
+                continue
+
+            converter = None
+            if ctype not in RELATIONSHIP_TYPES:
+                converter = self.exporter.get_value2str(
+                    ctype, model=description["model"]
+                )
+
+            res.append((name, ctype, description["model"], converter))
+
+        return res
+
+    def get_sub_fields(self, model, name):
+        """Return the exported fields of the sub records of the x2Many
+        field of the model, got only one time by export. The field linked to
+        the parent record is not exported, the sub records are linked by the
+        parent record when they are imported
+
+        :param model: registry name of the model of the parent record
+        :param name: name of the x2Many field
+        :rtype: list of tuple (name, type, model, converter)
+        """
+        key = (model, name)
+        if key not in self.sub_fields:
+            Model = self.anyblok.get(model)
+            description = Model.fields_description([name])[name]
+            remote_name = description.get("remote_name")
+            self.sub_fields[key] = [
+                field
+                for field in self.get_fields(model=description["model"])
+                if field[0] != remote_name
+            ]
+
+        return self.sub_fields[key]
+
+    def get_record(self, entry, fields, parents=()):
+        """Return the record node of the entry, in the format of the XML
+        importer, the Many2One and One2One are exported by their external
+        ids, the x2Many by sub records with their fields. An entry already
+        exported by a parent record is exported only by its external id
+
+        :param entry: exported instance
+        :param fields: exported fields of the model of the entry
+        :param parents: entries of the parent records
+        :rtype: record node
+        """
+        get_key_mapping = self.anyblok.IO.Exporter.get_key_mapping
+        record = etree.Element(
+            "record",
+            model=entry.__registry_name__,
+            external_id=get_key_mapping(entry),
+        )
+        if entry in parents:
+            return record
+
+        for name, ctype, model, converter in fields:
+            value = getattr(entry, name)
+            if value is None or (ctype in X2MANY_TYPES and not value):
+                continue
+
+            field = etree.SubElement(record, "field", name=name)
+            if ctype in X2MANY_TYPES:
+                sub_fields = self.get_sub_fields(entry.__registry_name__, name)
+                for sub_entry in value:
+                    field.append(
+                        self.get_record(
+                            sub_entry, sub_fields, parents=parents + (entry,)
+                        )
+                    )
+            elif ctype in RELATIONSHIP_TYPES:
+                field.set("external_id", get_key_mapping(value))
+            else:
+                field.text = converter(value)
+
+        return record
+
+    def run(self, entries, output=None, fields=None):
+        """Write the entries in the XML format of the importer, each record
+        is written as soon as the entry is got
+
+        :param entries: list or iterator of the entries
+        :param output: path or binary file object where the XML is written,
+                       if None the XML is written in a BytesIO
+        :param fields: names of the fields to export, all the fields if empty
+        :rtype: the output, or the BytesIO at the beginning
+        """
+        fp = BytesIO() if output is None else output
+        fields = self.get_fields(fields)
+        with etree.xmlfile(fp, encoding="utf-8") as xf:
+            xf.write_declaration()
+            with xf.element("records"):
+                for entry in entries:
+                    xf.write(self.get_record(entry, fields))
+
+        if output is None:
+            fp.seek(0)
+
+        return fp
@@ -6,7 +6,7 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 from anyblok import Declarations
-from anyblok.mapper import ModelAttribute
+from anyblok.column import Boolean
 from lxml import etree
 
 from .exceptions import XMLImporterException
@@ -20,6 +20,9 @@ on_error = "ignore"
 
 @register(IO)
 class Importer:
+    xml_streaming = Boolean(default=False)
+    xml_prescan = Boolean(default=False)
+
     @classmethod
     def get_mode_choices(cls):
         res = super(Importer, cls).get_mode_choices()
@@ -29,22 +32,52 @@ class Importer:
 
 @register(IO.Importer)
 class XML:
-    def __init__(self, importer, blokname=None):
+    # the file to import is read by ``Importer.open_file``
+    read_by_open_file = True
+
+    def __init__(self, importer, blokname=None, callback=None):
         self.importer = importer
+        self.callback = callback
         self.error_found = []
         self.created_entries = []
         self.updated_entries = []
+        self.nb_created_entries = 0
+        self.nb_updated_entries = 0
+        self.results_start = (0, 0)
+        self.unchanged = 0
         self.params = {}
         self.two_way_external_id = {}
+        self.two_way_to_map = {}
+        self.external_ids = {}
+        self.prescanned = False
+        self.mappings_to_set = None
+        self.converters = {}
+        self.keys_converters = {}
         self.blokname = blokname
 
     def commit(self):
         if self.error_found:
             return False
 
-        self.importer.commit()
+        self.flush_results(expunge=self.importer.commit())
         return True
 
+    def flush_results(self, expunge=False):
+        """Flush the results by the importer, the entries of the params and
+        of the two ways external ids not mapped yet are kept in the session
+        for the next records. The external ids of the entries removed from
+        the session are forgotten, they are found again by the mappings"""
+        exclude = list(self.params.values())
+        exclude.extend(self.two_way_external_id.values())
+        self.importer.flush_results(self, expunge=expunge, exclude=exclude)
+        if expunge:
+            session = self.anyblok.session
+            self.external_ids = {
+                key: entry
+                for key, entry in self.external_ids.items()
+                if entry is None or entry in session
+            }
+
     def _raise(self, msg, on_error=on_error, **kwargs):
         self.error_found.append(str(msg))
         if on_error == "raise":
@@ -57,6 +90,9 @@ class XML:
             if (model, external_id) in self.two_way_external_id:
                 return self.two_way_external_id[(model, external_id)]
 
+            if (model, external_id) in self.external_ids:
+                return self.external_ids[(model, external_id)]
+
             entry = self.anyblok.IO.Mapping.get(model, external_id)
             if entry:
                 return entry
@@ -123,6 +159,25 @@ class XML:
         except Exception as e:  # pragma: no cover
             self._raise(e, **kwargs)
 
+    def overwrite_entry(self, entry, values, **kwargs):
+        if self.importer.skip_unchanged and self.importer.is_unchanged(
+            entry, values, extend_x2many=True
+        ):
+            self.unchanged += 1
+            return
+
+        try:
+            insert_values = {
+                x: y for x, y in values.items() if not isinstance(y, list)
+            }
+            if insert_values:
+                entry.update(**insert_values)
+
+            self.update_x2M(entry, values, insert_values)
+            self.updated_entries.append(entry)
+        except Exception as e:  # pragma: no cover
+            self._raise(e, **kwargs)
+
     def map_imported_entry(
         self,
         model,
@@ -146,15 +201,48 @@ class XML:
 
             if external_id:
                 if two_way:
-                    self.two_way_external_id[(model, external_id)] = entry
+                    key = (model, external_id)
+                    self.two_way_external_id[key] = entry
+                    self.two_way_to_map[key] = (entry, if_exist == "create")
                 else:
                     raiseifexist = if_exist != "overwrite"
-                    self.anyblok.IO.Mapping.set(
-                        external_id,
-                        entry,
-                        blokname=self.blokname,
-                        raiseifexist=raiseifexist,
-                    )
+                    self.set_mapping(model, external_id, entry, raiseifexist)
+
+    def set_mapping(self, model, external_id, entry, raiseifexist):
+        """Save the mapping of the entry, during the import of the records
+        the mappings are saved in one time at the end of the group of
+        records"""
+        self.external_ids[(model, external_id)] = entry
+        if self.mappings_to_set is None:
+            self.anyblok.IO.Mapping.set(
+                external_id,
+                entry,
+                blokname=self.blokname,
+                raiseifexist=raiseifexist,
+            )
+        else:
+            self.mappings_to_set[(model, external_id)] = (entry, raiseifexist)
+
+    def flush_mappings(self):
+        """Save the mappings of the group of records, the two ways external
+        ids saved are forgotten, they are then found by the mappings"""
+        mappings, self.mappings_to_set = self.mappings_to_set, {}
+        self.two_way_external_id = {
+            key: entry for key, (entry, _) in self.two_way_to_map.items()
+        }
+        values = {}
+        for (model, external_id), (entry, raiseifexist) in mappings.items():
+            values.setdefault((model, raiseifexist), []).append(
+                (external_id, entry.to_primary_keys())
+            )
+
+        for (model, raiseifexist), mappings in values.items():
+            self.anyblok.IO.Mapping.set_many(
+                model,
+                mappings,
+                raiseifexist=raiseifexist,
+                blokname=self.blokname,
+            )
 
     def import_entry(
         self,
@@ -178,19 +266,7 @@ class XML:
                     Model, values, two_way, **kwargs
                 )
             elif if_exist == "overwrite":
-                try:
-                    insert_values = {
-                        x: y
-                        for x, y in values.items()
-                        if not isinstance(y, list)
-                    }
-                    if insert_values:
-                        entry.update(**insert_values)
-
-                    self.update_x2M(entry, values, insert_values)
-                    self.updated_entries.append(entry)
-                except Exception as e:  # pragma: no cover
-                    self._raise(e, **kwargs)
+                self.overwrite_entry(entry, values, **kwargs)
         elif if_does_not_exist == "create":
             return_entry = self.create_entry(Model, values, two_way, **kwargs)
 
@@ -238,6 +314,26 @@ class XML:
 
             return vals[0]
 
+    def get_str2value(
+        self, ctype, external_id=False, model=None, fieldname=None
+    ):
+        """Return the converter of the field, got only one time by import"""
+        key = (ctype, external_id, model, fieldname)
+        if key not in self.converters:
+            self.converters[key] = self.importer.get_str2value(
+                ctype, external_id=external_id, model=model, fieldname=fieldname
+            )
+
+        return self.converters[key]
+
+    def get_str2external_ids(self, ctype):
+        if ctype not in self.keys_converters:
+            self.keys_converters[ctype] = self.importer.get_str2external_ids(
+                ctype
+            )
+
+        return self.keys_converters[ctype]
+
     def get_from_param(self, param, model):
         if param:
             if model:
@@ -273,17 +369,19 @@ class XML:
                     res = self.two_way_external_id[(model, val)]
 
             if not res:
-                mapper = ModelAttribute(
-                    Model.__registry_name__, field.attrib["name"]
-                )
-                fieldname = mapper.get_fk_column(self.anyblok)
-                res = self.importer.str2value(
-                    val,
+                converter = self.get_str2value(
                     ctype,
                     external_id=external_id,
                     model=model,
-                    fieldname=fieldname,
+                    fieldname=self.importer.get_fk_column(
+                        Model.__registry_name__, field.attrib["name"]
+                    ),
                 )
+                if external_id:
+                    res = converter(val, external_ids=self.external_ids)
+                else:
+                    res = converter(val)
+
             if param:
                 self.params[(model, param)] = res
 
@@ -314,7 +412,9 @@ class XML:
             return None
 
         Model = self.anyblok.get(kwargs["model"])
-        fields_description = Model.fields_description()
+        fields_description = self.importer.get_fields_description(
+            kwargs["model"]
+        )
         values = {}
         for field in record.getchildren():
             if "on_error" in field.attrib:
@@ -332,16 +432,29 @@ class XML:
             values[field_name] = val
 
         entry = self.import_entry(entry, values, two_way=two_way, **kwargs)
-        if not two_way and self.two_way_external_id:
+        if not two_way and self.two_way_to_map:
             self.two_ways_to_external_id()
 
         return entry
 
     def two_ways_to_external_id(self):
-        for k, entry in self.two_way_external_id.items():
-            model, external_id = k
-            # FIXME no controle of if_exist
-            self.map_imported_entry(model, None, external_id, False, entry)
+        """Save the mappings of the sub records imported since the last
+        call, in one time with the mappings of the group of records. The
+        existing mappings are replaced, except for the sub records with
+        ``if_exist="create"`` which must not take an existing external id"""
+        to_map, self.two_way_to_map = self.two_way_to_map, {}
+        flush = self.mappings_to_set is None
+        if flush:
+            self.mappings_to_set = {}
+
+        for (model, external_id), (entry, raiseifexist) in to_map.items():
+            self.set_mapping(model, external_id, entry, raiseifexist)
+
+        if flush:
+            try:
+                self.flush_mappings()
+            finally:
+                self.mappings_to_set = None
 
     def validate_field(self, field, Model, fields_description, **_kw):
         if field.tag is etree.Comment:
@@ -389,24 +502,155 @@ class XML:
 
         return None
 
-    def import_records(self, records):
-        for record in records.getchildren():
-            if record.tag is etree.Comment:
-                continue  # pragma: no cover
-            elif record.tag.lower() == "record":
-                self.import_record(record, model=self.importer.model)
-            elif record.tag.lower() == "commit":
-                self.commit()
+    def collect_external_ids(self, record, model, keys_by_model):
+        """Collect the external ids used by the record and its sub records"""
+        model = record.attrib.get("model", model)
+        if not model or not self.anyblok.has(model):
+            return
+
+        if "external_id" in record.attrib:
+            keys_by_model.setdefault(model, set()).add(
+                record.attrib["external_id"]
+            )
+
+        fields_description = self.importer.get_fields_description(model)
+        for field in record.getchildren():
+            if not isinstance(field.tag, str) or field.tag.lower() != "field":
+                continue
+
+            description = fields_description.get(field.attrib.get("name"))
+            if description is not None:
+                self._collect_external_ids(field, description, keys_by_model)
+
+    def _collect_external_ids(self, field, description, keys_by_model):
+        field_model = field.attrib.get("model", description["model"])
+        children = field.getchildren()
+        if children:
+            if description["type"] in ("One2Many", "Many2Many"):
+                for child in children:
+                    if isinstance(child.tag, str):
+                        self.collect_external_ids(
+                            child, field_model, keys_by_model
+                        )
             else:
-                self._raise("%r is not known" % record.tag, **records.attrib)
+                self.collect_external_ids(field, field_model, keys_by_model)
+
+        elif field_model and "external_id" in field.attrib:
+            str2keys = self.get_str2external_ids(description["type"])
+            try:
+                keys = str2keys(field.attrib["external_id"])
+            except ValueError:
+                # the error will be raised when the field is imported
+                return
+
+            keys_by_model.setdefault(field_model, set()).update(keys)
+
+    def prefetch_external_ids(self, records):
+        """Resolve in a batch all the external ids used by the records"""
+        keys_by_model = {}
+        for record in records:
+            if isinstance(record.tag, str) and record.tag.lower() == "record":
+                self.collect_external_ids(
+                    record, self.importer.model, keys_by_model
+                )
+
+        self.external_ids = self.importer.get_external_ids(keys_by_model)
+
+    def prescan_external_ids(self, fp):
+        """Resolve in one time the external ids used by the whole file, the
+        file is read by a first parse which keeps in memory only the current
+        child of the records node"""
+        events = etree.iterparse(fp, events=("start", "end"))
+        records = next(events)[1]
+        self.prefetch_external_ids(
+            self.iter_parsed_children(records, events, remove=True)
+        )
+        self.prescanned = True
+        fp.seek(0)
+
+    def group_records(self, children):
+        """Iterate on the children by group of ``nb_grouped_lines``"""
+        nb_grouped_lines = self.importer.nb_grouped_lines
+        group = []
+        for child in children:
+            group.append(child)
+            if len(group) == nb_grouped_lines:
+                yield group
+                group = []
+
+        if group:
+            yield group
+
+    def iter_parsed_children(self, records, events, remove=False):
+        """Give each child of the records node as soon as it is parsed, if
+        ``remove`` is True the child is removed of the tree when the next
+        one is asked"""
+        for event, element in events:
+            if event == "end" and element.getparent() is records:
+                yield element
+                if remove:
+                    self.remove_records(records, element)
+
+    def remove_records(self, records, last):
+        """Remove of the tree the imported children, until ``last``"""
+        while last.getprevious() is not None:
+            del records[0]
+
+        records.remove(last)
+
+    def import_records(self, records, children=None):
+        """Import the children of the records node by group. If the
+        children are given while the file is parsed, each group is removed
+        of the tree after its import"""
+        streaming = children is not None
+        if not streaming:
+            children = records.getchildren()
+
+        self.mappings_to_set = {}
+        try:
+            for group in self.group_records(children):
+                self.flush_mappings()
+                if not self.prescanned:
+                    self.prefetch_external_ids(group)
+                for record in group:
+                    if record.tag is etree.Comment:
+                        continue  # pragma: no cover
+                    elif record.tag.lower() == "record":
+                        self.import_record(record, model=self.importer.model)
+                    elif record.tag.lower() == "commit":
+                        self.flush_mappings()
+                        self.commit()
+                    else:
+                        self._raise(
+                            "%r is not known" % record.tag, **records.attrib
+                        )
+
+                if streaming:
+                    self.remove_records(records, group[-1])
+
+            self.flush_mappings()
+        finally:
+            self.mappings_to_set = None
 
     def run(self):
-        records = etree.fromstring(self.importer.file_to_import)
-        if records.tag.lower() == "records":
-            self.import_records(records)
-        else:
-            self._raise("%r is not known" % records.tag)
+        with self.importer.open_file() as fp:
+            if self.importer.xml_prescan:
+                self.prescan_external_ids(fp)
+
+            children = None
+            if self.importer.xml_streaming:
+                events = etree.iterparse(fp, events=("start", "end"))
+                records = next(events)[1]
+                children = self.iter_parsed_children(records, events)
+            else:
+                records = etree.parse(fp).getroot()
+
+            if records.tag.lower() == "records":
+                self.import_records(records, children=children)
+            else:
+                self._raise("%r is not known" % records.tag)
 
+        self.flush_results()
         if self.error_found:
             if records.attrib.get("on_error", "raise") == "raise":
                 msg = "Exception found : \n %s" % "\n".join(self.error_found)
@@ -416,6 +660,9 @@ class XML:
             "error_found": self.error_found,
             "created_entries": self.created_entries,
             "updated_entries": self.updated_entries,
+            "nb_created_entries": self.nb_created_entries,
+            "nb_updated_entries": self.nb_updated_entries,
+            "unchanged": self.unchanged,
         }
 
     @classmethod
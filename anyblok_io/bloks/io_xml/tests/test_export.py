@@ -6,6 +6,9 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
+from lxml import etree
+
+from ..exceptions import ExporterException
 
 
 @pytest.mark.usefixtures("rollback_registry")
@@ -18,10 +21,135 @@ class TestExportXML:
         Exporter = self.registry.IO.Exporter.XML
         return Exporter.insert(model=Model, **kwargs)
 
+    def create_csv_exporter(self):
+        return self.registry.IO.Exporter.CSV.insert(
+            model="Model.System.Blok",
+            fields=[{"name": "name", "mode": "external_id"}, {"name": "state"}],
+        )
+
     def test_export_anyblok_core(self):
         Blok = self.registry.System.Blok
-        fields = [{"name": "name", "mode": "external_id"}, {"name": "state"}]
-        exporter = self.create_exporter(Blok, fields=fields)
+        exporter = self.create_exporter(Blok)
         blok = Blok.from_primary_keys(name="anyblok-core")
-        with pytest.raises(NotImplementedError):
-            exporter.run([blok])
+        records = etree.parse(exporter.run([blok])).getroot()
+        assert records.tag == "records"
+        assert len(records) == 1
+        record = records[0]
+        assert record.get("model") == "Model.System.Blok"
+        assert record.get("external_id") == (
+            self.registry.IO.Exporter.get_key_mapping(blok)
+        )
+        fields = {field.get("name"): field.text for field in record}
+        assert fields["name"] == "anyblok-core"
+        assert fields["state"] == "installed"
+        assert "logo" not in fields
+
+    def test_export_fields(self):
+        Blok = self.registry.System.Blok
+        exporter = self.create_exporter(Blok)
+        query = Blok.query().filter(
+            Blok.name.in_(["anyblok-core", "anyblok-io"])
+        )
+        records = etree.parse(
+            exporter.run(query.yield_per(1), fields=["name"])
+        ).getroot()
+        assert [[field.get("name") for field in x] for x in records] == [
+            ["name"],
+            ["name"],
+        ]
+
+    def test_export_to_file(self, tmp_path):
+        Blok = self.registry.System.Blok
+        exporter = self.create_exporter(Blok)
+        path = str(tmp_path / "export.xml")
+        assert exporter.run(Blok.query().limit(2), output=path) == path
+        assert len(etree.parse(path).getroot()) == 2
+
+    def test_export_relationships(self):
+        Exporter = self.registry.IO.Exporter
+        Mapping = self.registry.IO.Mapping
+        csv_exporter = self.create_csv_exporter()
+        exporter = self.create_exporter(Exporter)
+        record = etree.parse(exporter.run([csv_exporter])).getroot()[0]
+        fields = {field.get("name"): field for field in record}
+        assert "id" not in fields
+        assert fields["model"].text == "Model.System.Blok"
+        assert [
+            Mapping.get(x.get("model"), x.get("external_id"))
+            for x in fields["fields_to_export"]
+        ] == csv_exporter.fields_to_export
+        assert [
+            {x.get("name"): x.text for x in sub_record}
+            for sub_record in fields["fields_to_export"]
+        ] == [
+            {"mode": "external_id", "name": "name"},
+            {"mode": "any", "name": "state"},
+        ]
+
+        exporter = self.create_exporter(Exporter.Field)
+        field = csv_exporter.fields_to_export[0]
+        record = etree.parse(exporter.run([field])).getroot()[0]
+        fields = {x.get("name"): x for x in record}
+        assert "exporter_id" not in fields
+        assert (
+            Mapping.get(
+                "Model.IO.Exporter", fields["exporter"].get("external_id")
+            )
+            is csv_exporter
+        )
+
+    def test_export_iterator_with_entries_doesnt_come_from_model(self):
+        Blok = self.registry.System.Blok
+        exporter = self.create_exporter(Blok)
+        with pytest.raises(ExporterException):
+            exporter.run(iter([exporter]))
+
+    def test_export_then_import(self):
+        csv_exporter = self.create_csv_exporter()
+        field = csv_exporter.fields_to_export[1]
+        exporter = self.create_exporter(self.registry.IO.Exporter.Field)
+        fp = exporter.run(csv_exporter.fields_to_export)
+        field.name = "other"
+        importer = self.registry.IO.Importer.XML.insert(
+            model="Model.IO.Exporter.Field", file_to_import=fp.read()
+        )
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert len(res["updated_entries"]) == 2
+        assert field.name == "state"
+        assert field.exporter is csv_exporter
+
+    def test_export_then_import_new_sub_records(self):
+        csv_exporter = self.create_csv_exporter()
+        exporter = self.create_exporter(self.registry.IO.Exporter)
+        fp = exporter.run([csv_exporter])
+        for field in csv_exporter.fields_to_export:
+            field.delete()
+
+        csv_exporter.delete()
+        importer = self.registry.IO.Importer.XML.insert(
+            model="Model.IO.Exporter", file_to_import=fp.read()
+        )
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert len(res["created_entries"]) == 3
+        csv_exporter = res["created_entries"][-1]
+        assert csv_exporter.model == "Model.System.Blok"
+        assert [(x.name, x.mode) for x in csv_exporter.fields_to_export] == [
+            ("name", "external_id"),
+            ("state", "any"),
+        ]
+
+    def test_export_entry_of_a_parent_record_by_its_external_id(self):
+        csv_exporter = self.create_csv_exporter()
+        exporter = self.registry.IO.Exporter.XML(
+            self.create_exporter(self.registry.IO.Exporter)
+        )
+        fields = exporter.get_fields()
+        record = exporter.get_record(
+            csv_exporter, fields, parents=(csv_exporter,)
+        )
+        assert len(record) == 0
+        assert record.get("external_id") == (
+            self.registry.IO.Exporter.get_key_mapping(csv_exporter)
+        )
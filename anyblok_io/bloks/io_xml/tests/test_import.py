@@ -10,6 +10,7 @@ from os import urandom
 import pytest
 from lxml import etree
 
+from ...io.exceptions import IOMappingSetException
 from ..exceptions import XMLImporterException
 
 
@@ -28,9 +29,13 @@ class TestImportXML:
             file_to_import = urandom(100000)
         return XML.insert(file_to_import=file_to_import, **kwargs)
 
-    def create_XML_importer(self, blokname=None, **kwargs):
+    def create_XML_importer(self, blokname=None, callback=None, **kwargs):
         XML = self.registry.IO.Importer.XML
-        return XML(self.create_importer(**kwargs), blokname=blokname)
+        return XML(
+            self.create_importer(**kwargs),
+            blokname=blokname,
+            callback=callback,
+        )
 
     def test_commit_if_error_found(self):
         importer = self.create_XML_importer()
@@ -275,6 +280,75 @@ class TestImportXML:
         assert len(importer.error_found) == 0
         assert len(importer.created_entries) == 2
 
+    def test_two_ways_to_external_id(self):
+        model = "Model.IO.Exporter"
+        Exporter = self.registry.IO.Exporter
+        Mapping = self.registry.IO.Mapping
+        exporter1 = Exporter.insert(model=model, mode=model + ".CSV")
+        exporter2 = Exporter.insert(model=model, mode=model + ".XML")
+        Mapping.set("two_way2", exporter1)
+        importer = self.create_XML_importer()
+        importer.map_imported_entry(model, None, "two_way1", True, exporter1)
+        importer.map_imported_entry(model, None, "two_way2", True, exporter2)
+        importer.two_ways_to_external_id()
+        assert importer.two_way_to_map == {}
+        assert Mapping.get(model, "two_way1") is exporter1
+        assert Mapping.get(model, "two_way2") is exporter2
+        assert importer.two_way_external_id == {}
+        assert importer.find_entry(model, "two_way1") is exporter1
+        assert importer.find_entry(model, "two_way2") is exporter2
+
+    def test_run_forget_the_mapped_two_ways_external_ids(self):
+        model = "Model.IO.Exporter"
+        records = etree.Element("records")
+        record = etree.SubElement(records, "record")
+        record.set("model", model)
+        for name, value in (("model", model), ("mode", model + ".XML")):
+            field = etree.SubElement(record, "field")
+            field.set("name", name)
+            field.text = value
+
+        field = etree.SubElement(record, "field")
+        field.set("name", "fields_to_export")
+        sub_record = etree.SubElement(field, "record")
+        sub_record.set("external_id", "two_way_field")
+        field = etree.SubElement(sub_record, "field")
+        field.set("name", "name")
+        field.text = "model"
+        record = etree.SubElement(records, "record")
+        record.set("model", "Model.IO.Exporter.Field")
+        record.set("external_id", "two_way_field")
+        field = etree.SubElement(record, "field")
+        field.set("name", "name")
+        field.text = "mode"
+
+        importer = self.create_XML_importer(
+            file_to_import=etree.tostring(records),
+            nb_grouped_lines=1,
+            commit_at_each_grouped=False,
+        )
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert importer.two_way_external_id == {}
+        field = self.registry.IO.Mapping.get(
+            "Model.IO.Exporter.Field", "two_way_field"
+        )
+        assert field.name == "mode"
+        assert res["updated_entries"] == [field]
+
+    def test_two_ways_to_external_id_if_exist_create(self):
+        model = "Model.IO.Exporter"
+        Exporter = self.registry.IO.Exporter
+        exporter1 = Exporter.insert(model=model, mode=model + ".CSV")
+        exporter2 = Exporter.insert(model=model, mode=model + ".XML")
+        self.registry.IO.Mapping.set("two_way", exporter1)
+        importer = self.create_XML_importer()
+        importer.map_imported_entry(
+            model, None, "two_way", True, exporter2, if_exist="create"
+        )
+        with pytest.raises(IOMappingSetException):
+            importer.two_ways_to_external_id()
+
     def test_import_value(self):
         importer = self.create_XML_importer()
         model = "Model.IO.Exporter"
@@ -469,6 +543,62 @@ class TestImportXML:
         assert len(importer.error_found) == 0
         assert len(importer.created_entries) == 1
 
+    def test_prefetch_external_ids(self):
+        importer = self.create_XML_importer()
+        exporter = self.registry.IO.Exporter.XML.insert(
+            model="Model.IO.Exporter"
+        )
+        _model = self.registry.System.Model.query().get("Model.IO.Exporter")
+        self.registry.IO.Mapping.set("test_exporter", exporter)
+        self.registry.IO.Mapping.set("test_model", _model)
+        records = etree.Element("records")
+        record = etree.SubElement(records, "record")
+        record.set("model", "Model.IO.Exporter")
+        record.set("external_id", "test_exporter")
+        field = etree.SubElement(record, "field")
+        field.set("name", "model")
+        field.set("external_id", "test_model")
+        record = etree.SubElement(records, "record")
+        record.set("model", "Model.IO.Exporter")
+        record.set("external_id", "unknown")
+
+        importer.prefetch_external_ids(records.getchildren())
+        assert importer.external_ids == {
+            ("Model.IO.Exporter", "test_exporter"): exporter,
+            ("Model.IO.Exporter", "unknown"): None,
+            ("Model.System.Model", "test_model"): _model,
+        }
+
+    def test_import_records_with_external_id(self):
+        importer = self.create_XML_importer(
+            nb_grouped_lines=1, commit_at_each_grouped=False
+        )
+        model = "Model.IO.Exporter"
+        records = etree.Element("records")
+        for external_id, mode in (
+            ("exporter1", "Model.IO.Exporter.CSV"),
+            ("exporter2", "Model.IO.Exporter.CSV"),
+            ("exporter1", "Model.IO.Exporter.XML"),
+        ):
+            record = etree.SubElement(records, "record")
+            record.set("model", model)
+            record.set("external_id", external_id)
+            field = etree.SubElement(record, "field")
+            field.set("name", "model")
+            field.text = model
+            field = etree.SubElement(record, "field")
+            field.set("name", "mode")
+            field.text = mode
+
+        importer.import_records(records)
+        assert len(importer.error_found) == 0
+        assert len(importer.created_entries) == 2
+        assert len(importer.updated_entries) == 1
+        Mapping = self.registry.IO.Mapping
+        exporter1 = Mapping.get(model, "exporter1")
+        assert exporter1.mode == "Model.IO.Exporter.XML"
+        assert Mapping.get(model, "exporter2") == importer.created_entries[1]
+
     def test_import_records_with_bad_node(self):
         importer = self.create_XML_importer()
         model = "Model.IO.Exporter"
@@ -561,6 +691,202 @@ class TestImportXML:
         assert len(res["created_entries"]) == 1
         assert len(res["updated_entries"]) == 0
 
+    def test_run_skip_unchanged(self):
+        model = "Model.IO.Exporter"
+        Exporter = self.registry.IO.Exporter
+        Mapping = self.registry.IO.Mapping
+        for key in ("exporter1", "exporter2"):
+            exporter = Exporter.insert(model=model, mode=model + ".CSV")
+            Mapping.set(key, exporter)
+
+        records = etree.Element("records")
+        for key, mode in (("exporter1", ".CSV"), ("exporter2", ".XML")):
+            record = etree.SubElement(records, "record")
+            record.set("model", model)
+            record.set("external_id", key)
+            field = etree.SubElement(record, "field")
+            field.set("name", "mode")
+            field.text = model + mode
+
+        file_to_import = etree.tostring(records)
+        importer = self.create_XML_importer(
+            file_to_import=file_to_import, skip_unchanged=True
+        )
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert res["updated_entries"] == [Mapping.get(model, "exporter2")]
+        assert res["unchanged"] == 1
+
+    def test_run_from_file_path(self, tmp_path):
+        model = "Model.IO.Exporter"
+        records = etree.Element("records")
+        record = etree.SubElement(records, "record")
+        record.set("model", model)
+        for name, value in (("model", model), ("mode", model + ".XML")):
+            field = etree.SubElement(record, "field")
+            field.set("name", name)
+            field.text = value
+
+        path = tmp_path / "file.xml"
+        path.write_bytes(etree.tostring(records))
+        importer = self.create_XML_importer(file_path=str(path))
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert len(res["created_entries"]) == 1
+        assert res["created_entries"][0].mode == model + ".XML"
+
+    def test_run_with_primary_keys(self):
+        model = "Model.IO.Exporter"
+        records = etree.Element("records")
+        for mode in (".CSV", ".XML"):
+            record = etree.SubElement(records, "record")
+            record.set("model", model)
+            for name, value in (("model", model), ("mode", model + mode)):
+                field = etree.SubElement(record, "field")
+                field.set("name", name)
+                field.text = value
+
+        batches = []
+        importer = self.create_XML_importer(
+            file_to_import=etree.tostring(records),
+            result_mode="primary_keys",
+            callback=lambda created, updated: batches.append(created),
+        )
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert res["nb_created_entries"] == 2
+        assert [x.mode for x in batches[0]] == [model + ".CSV", model + ".XML"]
+        assert res["created_entries"] == [
+            x.to_primary_keys() for x in batches[0]
+        ]
+
+    def test_run_with_counts_and_commit(self, monkeypatch):
+        def commit():
+            self.registry.flush()
+            self.registry.expire_all()
+
+        monkeypatch.setattr(self.registry, "commit", commit)
+        model = "Model.IO.Exporter"
+        records = etree.Element("records")
+        record = etree.SubElement(records, "record")
+        record.set("model", model)
+        record.set("external_id", "exp1")
+        for name, value in (("model", model), ("mode", model + ".XML")):
+            field = etree.SubElement(record, "field")
+            field.set("name", name)
+            field.text = value
+
+        etree.SubElement(records, "commit")
+        record = etree.SubElement(records, "record")
+        record.set("model", "Model.IO.Exporter.Field")
+        field = etree.SubElement(record, "field")
+        field.set("name", "exporter")
+        field.set("external_id", "exp1")
+        field = etree.SubElement(record, "field")
+        field.set("name", "name")
+        field.text = "mode"
+
+        importer = self.create_XML_importer(
+            file_to_import=etree.tostring(records), result_mode="counts"
+        )
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert res["nb_created_entries"] == 2
+        exporter = self.registry.IO.Mapping.get(model, "exp1")
+        Field = self.registry.IO.Exporter.Field
+        assert Field.query().filter_by(exporter=exporter).count() == 1
+
+    def get_streaming_records(self):
+        model = "Model.IO.Exporter"
+        records = etree.Element("records")
+        for mode in (".CSV", "commit", ".XML"):
+            if mode == "commit":
+                etree.SubElement(records, "commit")
+                continue
+
+            record = etree.SubElement(records, "record")
+            record.set("model", model)
+            record.set("external_id", "streamed_exporter")
+            for name, value in (("model", model), ("mode", model + mode)):
+                field = etree.SubElement(record, "field")
+                field.set("name", name)
+                field.text = value
+
+        return records
+
+    def test_import_records_remove_the_parsed_records(self):
+        records = self.get_streaming_records()
+        importer = self.create_XML_importer(
+            nb_grouped_lines=2, commit_at_each_grouped=False
+        )
+        importer.import_records(records, children=iter(list(records)))
+        assert len(importer.error_found) == 0
+        assert len(records) == 0
+
+    def test_run_streaming(self):
+        importer = self.create_XML_importer(
+            file_to_import=etree.tostring(self.get_streaming_records()),
+            nb_grouped_lines=1,
+            commit_at_each_grouped=False,
+            xml_streaming=True,
+        )
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert len(res["created_entries"]) == 1
+        assert res["updated_entries"] == res["created_entries"]
+        exporter = self.registry.IO.Mapping.get(
+            "Model.IO.Exporter", "streamed_exporter"
+        )
+        assert exporter.mode == "Model.IO.Exporter.XML"
+
+    def test_run_streaming_bad_root_name(self):
+        records = etree.Element("badrootname")
+        records.set("on_error", "ignore")
+        etree.SubElement(records, "record")
+        importer = self.create_XML_importer(
+            file_to_import=etree.tostring(records), xml_streaming=True
+        )
+        res = importer.run()
+        assert len(res["error_found"]) == 1
+        assert len(res["created_entries"]) == 0
+
+    def test_run_with_prescan(self, monkeypatch):
+        model = "Model.IO.Exporter"
+        exporter = self.registry.IO.Exporter.insert(
+            model=model, mode=model + ".CSV"
+        )
+        self.registry.IO.Mapping.set("prescanned_exporter", exporter)
+        records = etree.Element("records")
+        for external_id in ("prescanned_exporter", "new_exporter"):
+            record = etree.SubElement(records, "record")
+            record.set("model", model)
+            record.set("external_id", external_id)
+            for name, value in (("model", model), ("mode", model + ".XML")):
+                field = etree.SubElement(record, "field")
+                field.set("name", name)
+                field.text = value
+
+        importer = self.create_XML_importer(
+            file_to_import=etree.tostring(records),
+            nb_grouped_lines=1,
+            commit_at_each_grouped=False,
+            xml_prescan=True,
+        )
+        calls = []
+        get_external_ids = importer.importer.get_external_ids
+
+        def count_calls(keys_by_model):
+            calls.append(keys_by_model)
+            return get_external_ids(keys_by_model)
+
+        monkeypatch.setattr(importer.importer, "get_external_ids", count_calls)
+        res = importer.run()
+        assert len(res["error_found"]) == 0
+        assert calls == [{model: {"prescanned_exporter", "new_exporter"}}]
+        assert res["updated_entries"] == [exporter]
+        assert exporter.mode == model + ".XML"
+        assert len(res["created_entries"]) == 1
+
     def test_run_bad_root_name(self):
         model = "Model.IO.Exporter"
         records = etree.Element("badrootname")
@@ -7,7 +7,30 @@
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
 
-from anyblok_io.blok import BlokImporterException
+from anyblok_io.blok import BlokImporter, BlokImporterException
+
+
+class MockImporter:
+    inserted = None
+
+    @classmethod
+    def insert(cls, **kwargs):
+        cls.inserted = kwargs
+        return cls()
+
+    def run(self, blokname):
+        return {"error": []}
+
+    def delete(self):
+        pass
+
+
+class MockOpenFileImporter(MockImporter):
+    read_by_open_file = True
+
+
+class MockBlok(BlokImporter):
+    name = "test-io-blok1"
 
 
 class TestBlok:
@@ -36,3 +59,24 @@ class TestBlok3:
     def test_import_file_xml_ko(self, registry_testblok):
         with pytest.raises(BlokImporterException):
             registry_testblok.upgrade(install=("test-io-blok4",))
+
+
+class TestBlokImporter:
+    def test_import_file_without_counts(self, registry_testblok):
+        res = MockBlok().import_file(MockImporter, "Model.Exemple", "file.csv")
+        assert res == {"error": []}
+
+    def test_import_file_with_file_to_import(self, registry_testblok):
+        MockBlok().import_file(MockImporter, "Model.Exemple", "file.csv")
+        inserted = MockImporter.inserted
+        assert inserted["file_path"].endswith("file.csv")
+        with open(inserted["file_path"], "rb") as fp:
+            assert inserted["file_to_import"] == fp.read()
+
+    def test_import_file_read_by_open_file(self, registry_testblok):
+        MockBlok().import_file(
+            MockOpenFileImporter, "Model.Exemple", "file.csv"
+        )
+        inserted = MockOpenFileImporter.inserted
+        assert inserted["file_path"].endswith("file.csv")
+        assert "file_to_import" not in inserted